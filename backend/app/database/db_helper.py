@@ -1,4 +1,5 @@
 from asyncio import current_task
+from uuid import uuid4
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -11,10 +12,46 @@ from loguru import logger
 
 
 class DatabaseHelper:
-    def __init__(self, url: str, echo: bool = False):
-        self.engine = create_async_engine(
-            url=url, echo=echo, poolclass=NullPool, pool_pre_ping=True
-        )
+    def __init__(
+        self,
+        url: str,
+        echo: bool = False,
+        pool_mode: str = "pooled",
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+    ):
+        """
+        pool_mode is one of:
+        - "pooled": keep a per-process pool of open connections,
+        - "null": open a new connection for every session,
+        - "external": no local pool, connections go through pgbouncer or a similar
+          pooler in transaction mode, so prepared statements must not be cached.
+        """
+        if pool_mode == "pooled":
+            options = {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_timeout": pool_timeout,
+                "pool_recycle": pool_recycle,
+                "pool_pre_ping": pool_pre_ping,
+            }
+        elif pool_mode in ("null", "external"):
+            options = {"poolclass": NullPool, "pool_pre_ping": pool_pre_ping}
+        else:
+            raise ValueError(f"Unknown database pool mode: {pool_mode}")
+
+        if pool_mode == "external":
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                # Unique names, the pooler may hand us a backend that already has ours.
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+
+        self.engine = create_async_engine(url=url, echo=echo, **options)
         self.session_factory = async_sessionmaker(
             bind=self.engine, expire_on_commit=False, autoflush=False, autocommit=False
         )
@@ -41,4 +78,13 @@ class DatabaseHelper:
             await session.close()
 
 
-db_helper = DatabaseHelper(settings.DATABASE_URL, settings.DEBUG)
+db_helper = DatabaseHelper(
+    settings.DATABASE_URL,
+    settings.DEBUG,
+    pool_mode=settings.DB_POOL_MODE,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
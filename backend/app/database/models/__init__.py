@@ -8,3 +8,5 @@ from .special import Special, SpecialTypeEnum
 from .chance_command import ChanceCommand, ChanceCommandTypeEnum
 from .user import User
 from .player import Player
+from .game_event import GameEvent
+from .game_snapshot import GameSnapshot
@@ -0,0 +1,15 @@
+import uuid
+from sqlalchemy import BigInteger, Index, Integer, JSON, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database.models.base import Base
+
+
+class GameEvent(Base):
+    # Corresponds to table "gameevents"
+    # One applied action of a room, e.g. ["roll", seat, dice1, dice2].
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    game: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    action: Mapped[list] = mapped_column(JSON, nullable=False)
+
+    __table_args__ = (Index("ix_gameevents_game_seq", "game", "seq", unique=True),)
@@ -0,0 +1,12 @@
+import uuid
+from sqlalchemy import Integer, LargeBinary, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database.models.base import Base
+
+
+class GameSnapshot(Base):
+    # Corresponds to table "gamesnapshots"
+    # Latest GameState.dumps() of a room, events after seq are replayed on top.
+    game: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False, unique=True)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
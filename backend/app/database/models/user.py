@@ -57,7 +57,9 @@ class User(Base):
             return None
 
         user = await cls.find_one(session, **kwargs)
-        return user if user and verify_password(password, user.password) else None
+        if user and await verify_password(password, user.password):
+            return user
+        return None
 
     @classmethod
     async def find_by_email(cls, session: AsyncSession, email: str):
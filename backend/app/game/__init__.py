@@ -1 +1,2 @@
-from .game_data_loader import load_game_data, reload_game_data
+# Nothing is imported here, the rules and the simulator must keep working without
+# the settings and database the rest of the package needs.
@@ -1,20 +1,27 @@
 from fastapi import (
     WebSocket,
     APIRouter,
-    WebSocketDisconnect,
     Depends,
+    HTTPException,
+    WebSocketDisconnect,
     WebSocketException,
+    Response,
+    status,
 )
 import uuid
-
-from sqlalchemy import select
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
 from app.database import db_helper
-from app.database.models import Tile, Property
+from app.database.models import Player
+from app.game.board import board_cache
 from app.game.game_manager import GameManager
-from app.user.tokens import decode_token
+from app.game.lobby import Pool, pool_for
+from app.game.markov import for_board
+from app.settings import settings
+from app.user.cookie import oauth2_scheme
+from app.user.schemas import ResponseModel
+from app.user.tokens import decode_token, decode_resume_token, session_id
 
 router = APIRouter(prefix="/ws/game", tags=["game"])
 manager = GameManager()
@@ -22,39 +29,118 @@ manager = GameManager()
 
 # test only
 @router.get("/")
-async def get(session: AsyncSession = Depends(db_helper.session_dependency)):
-    query = select(Tile).options(
-        joinedload(Tile.property).joinedload(Property.group),
-        joinedload(Tile.railway),
-        joinedload(Tile.company),
-        joinedload(Tile.special),
+async def get():
+    return Response(content=board_cache.snapshot.payload, media_type="application/json")
+
+
+@router.get("/landing-probabilities")
+async def landing_probabilities():
+    board = board_cache.snapshot
+    return {"version": board.version, "tiles": for_board(board).tolist()}
+
+
+@router.get("/metrics")
+async def metrics():
+    return manager.metrics() | {"lobby_rooms": await manager.backend.public_rooms()}
+
+
+def current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    try:
+        return int(decode_token(token)["sub"])
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+async def player_pool(
+    region: str = settings.LOBBY_REGIONS[0],
+    user_id: int = Depends(current_user_id),
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> Pool:
+    if region not in settings.LOBBY_REGIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown region"
+        )
+    player = await Player.find_one(session, id=user_id)
+    return pool_for(region, player.games_played if player is not None else 0)
+
+
+@router.get("/lobby", response_model=ResponseModel)
+async def open_rooms(pool: Pool = Depends(player_pool)):
+    return ResponseModel(
+        message="Open rooms", data={"rooms": await manager.backend.open_rooms(pool)}
+    )
+
+
+@router.post("/lobby/quick-join", response_model=ResponseModel)
+async def quick_join(
+    pool: Pool = Depends(player_pool), user_id: int = Depends(current_user_id)
+):
+    """Reserves a seat in an open room, the client connects to it right after."""
+    game = await manager.backend.quick_join(user_id, pool)
+    return ResponseModel(
+        message="Seat reserved",
+        data={"game": game, "expires_in": settings.LOBBY_RESERVATION_SECONDS},
+    )
+
+
+@router.post("/lobby/{game_uuid}", response_model=ResponseModel)
+async def reserve_seat(
+    game_uuid: uuid.UUID,
+    pool: Pool = Depends(player_pool),
+    user_id: int = Depends(current_user_id),
+):
+    """Reserves a seat in an open room of the caller's pool."""
+    if not await manager.backend.reserve_seat(game_uuid, user_id, pool):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="No free seat in this room"
+        )
+    return ResponseModel(
+        message="Seat reserved",
+        data={"game": game_uuid, "expires_in": settings.LOBBY_RESERVATION_SECONDS},
     )
-    result = await session.execute(query)
-    tiles = result.scalars().all()
-    return tiles
 
 
 @router.websocket("/{game_uuid}")
 async def websocket_endpoint(
     websocket: WebSocket,
     game_uuid: uuid.UUID,
-    session: AsyncSession = Depends(db_helper.session_dependency),
+    resume: Optional[str] = None,
+    since: Optional[int] = None,
 ):
-    token: str = websocket.cookies.get("access_token")
-    if not token or "Bearer" not in token:
-        raise WebSocketException(code=403)
+    # The session cookie is checked whenever the client sends it.
+    token: Optional[str] = websocket.cookies.get("access_token")
+    payload, session = None, None
+    if token:
+        if "Bearer" not in token:
+            raise WebSocketException(code=403)
+        try:
+            payload = decode_token(token.split(" ")[1])
+        except Exception:
+            raise WebSocketException(code=403)
+        session = session_id(token.split(" ")[1])
 
-    try:
-        payload = decode_token(token.split(" ")[1])
-    except Exception:
+    # A resume token issued on connect stands in for the username lookup, and
+    # for the cookie on a node it is not sent to, when the client reconnects
+    # to the same game shortly after.
+    claims = decode_resume_token(resume, str(game_uuid), session) if resume else None
+    if claims is not None and (payload is None or int(payload.get("sub")) == claims["user"]):
+        user_id, username, session = claims["user"], claims["name"], claims.get("session")
+    elif payload is not None:
+        user_id, username, since = int(payload.get("sub")), None, None
+    else:
         raise WebSocketException(code=403)
 
-    user_id = int(payload.get("sub"))
-    await manager.connect(game_uuid, websocket, user_id, session)
+    # Everything touching the room runs in its actor, one command at a time.
+    if not await manager.call(
+        game_uuid, manager.connect, websocket, user_id, username, since, session
+    ):
+        return
 
     try:
         while True:
-            data = await websocket.receive_json()
-            await manager.process_message(game_uuid, websocket, data, user_id)
+            data = await manager.receive(websocket)
+            await manager.post(
+                game_uuid, manager.process_message, websocket, data, user_id
+            )
     except WebSocketDisconnect:
-        await manager.disconnect(game_uuid, websocket, user_id)
+        await manager.call(game_uuid, manager.disconnect, websocket, user_id)
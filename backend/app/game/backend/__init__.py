@@ -0,0 +1,3 @@
+from .base import BoardHandler, RoomBackend, WORKER_ID, WORKER_HOST, worker_host
+from .memory import MemoryRoomBackend
+from .factory import create_room_backend
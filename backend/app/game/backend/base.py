@@ -0,0 +1,130 @@
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Iterable, Optional
+
+from app.settings import settings
+
+# Identifies this worker process in messages shared with other workers,
+# the host part is the node name the reverse proxy can route a client to.
+WORKER_HOST = settings.NODE_NAME or socket.gethostname()
+WORKER_ID = f"{WORKER_HOST}:{os.getpid()}"
+
+# Called with (game, kind, text) for every frame published by another worker.
+MessageHandler = Callable[[uuid.UUID, str, str], None]
+# Called with the digest of the board last loaded by any worker.
+BoardHandler = Callable[[str], Awaitable[None]]
+
+
+def worker_host(worker_id: str) -> str:
+    return worker_id.rsplit(":", 1)[0]
+
+
+class RoomBackend(ABC):
+    """
+    Where room state is kept and how broadcasts reach the other workers.
+    Sockets are always local to a worker: a broadcast is delivered to the local
+    sockets directly and published for the others, which deliver it to theirs.
+
+    Each room is owned by one worker through a renewable lease. The owner keeps
+    the authoritative copy in memory, the others have to reload it per action.
+
+    The lobby index of public rooms and the seats reserved in them live here
+    too, so every worker matches players against the same rooms. Pools are the
+    (region, skill bracket) pairs of lobby.pool_for.
+    """
+
+    # Whether other workers read the saved state, rooms are only serialized for
+    # save_state if they do.
+    shares_state = False
+
+    async def start(
+        self, on_message: MessageHandler, on_board: Optional[BoardHandler] = None
+    ):
+        """
+        Starts delivering frames published by other workers to on_message, and
+        the digest of the board whenever a worker announces a reload to on_board.
+        """
+
+    async def stop(self):
+        """Stops background tasks and releases connections."""
+
+    async def announce_board(self, digest: str):
+        """Tells every worker the board was reloaded and now has this digest."""
+
+    @abstractmethod
+    async def load_state(self, game: uuid.UUID) -> Optional[bytes]:
+        """Returns the last saved state of a room, if any."""
+
+    @abstractmethod
+    async def save_state(self, game: uuid.UUID, data: bytes):
+        """Stores the serialized state of a room."""
+
+    @abstractmethod
+    async def delete_state(self, game: uuid.UUID):
+        """Forgets a room."""
+
+    @abstractmethod
+    async def mark_logged(self, game: uuid.UUID):
+        """Records that the game log has actions of the room."""
+
+    @abstractmethod
+    async def is_logged(self, game: uuid.UUID) -> bool:
+        """Whether the room may be in the game log, False for rooms never used."""
+
+    @abstractmethod
+    async def acquire_room(self, game: uuid.UUID) -> str:
+        """Takes the room lease if it is free, returns the owning WORKER_ID."""
+
+    @abstractmethod
+    async def release_room(self, game: uuid.UUID):
+        """Gives up the room lease, after persisting any pending state."""
+
+    @abstractmethod
+    def owns(self, game: uuid.UUID) -> bool:
+        """Whether this worker currently holds the room lease."""
+
+    @abstractmethod
+    def publish(self, game: uuid.UUID, kind: str, text: str):
+        """Queues an encoded frame for the other workers, never blocks."""
+
+    @abstractmethod
+    async def quick_join(self, user_id: int, pool: tuple[str, int]) -> uuid.UUID:
+        """
+        Reserves a seat in the fullest open public room of the pool, or in a new
+        one, giving up the user's previous reservation. Returns the room.
+        """
+
+    @abstractmethod
+    async def reserve_seat(
+        self, game: uuid.UUID, user_id: int, pool: tuple[str, int]
+    ) -> bool:
+        """
+        Reserves a seat in a public room of the pool, giving up the user's
+        previous reservation. False if the room is not open in that pool or full.
+        """
+
+    @abstractmethod
+    async def has_seat(self, game: uuid.UUID, user_id: int, seated: int) -> bool:
+        """
+        Whether the user may join next to the seated users, seats reserved for
+        others count as taken.
+        """
+
+    @abstractmethod
+    async def update_public_room(
+        self, game: uuid.UUID, users: Iterable[int], is_open: bool
+    ):
+        """Takes in who is seated in a room and whether it still takes players."""
+
+    @abstractmethod
+    async def open_rooms(self, pool: tuple[str, int]) -> list[dict]:
+        """Open public rooms of the pool with their free seats, fullest first."""
+
+    @abstractmethod
+    async def public_rooms(self) -> int:
+        """Number of public rooms taking players."""
+
+    async def expire_reservations(self):
+        """Gives up expired reservations, backends expiring them lazily skip this."""
@@ -0,0 +1,19 @@
+from app.settings import settings
+from .base import RoomBackend
+from .memory import MemoryRoomBackend
+
+
+def create_room_backend() -> RoomBackend:
+    if settings.ROOM_BACKEND == "redis":
+        # Only needed when rooms are shared, keep the import out of the default path.
+        from redis.asyncio import Redis
+        from .redis_backend import RedisRoomBackend
+
+        return RedisRoomBackend(
+            Redis.from_url(settings.REDIS_URL),
+            state_ttl=settings.ROOM_STATE_TTL,
+            lease_seconds=settings.ROOM_LEASE_SECONDS,
+            reservation_seconds=settings.LOBBY_RESERVATION_SECONDS,
+            log_ttl=settings.GAME_LOG_TTL,
+        )
+    return MemoryRoomBackend()
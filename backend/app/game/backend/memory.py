@@ -0,0 +1,77 @@
+import uuid
+from typing import Iterable, Optional, Set
+
+from app.settings import settings
+from ..game_log import game_log
+from ..lobby import Lobby, Pool
+from .base import RoomBackend, BoardHandler, MessageHandler, WORKER_ID
+
+
+class MemoryRoomBackend(RoomBackend):
+    """
+    Single worker backend. GameManager.active_games already is the only copy of
+    every room and there is nobody to publish to, so everything but the lobby
+    is a no-op.
+
+    Which rooms have a game log is read from the log once at start, rooms of a
+    previous run are only found there.
+    """
+
+    def __init__(self):
+        self.lobby = Lobby(settings.LOBBY_RESERVATION_SECONDS)
+        self.logged: Set[uuid.UUID] = set()
+
+    async def start(
+        self, on_message: MessageHandler, on_board: Optional[BoardHandler] = None
+    ):
+        self.logged = await game_log.games()
+
+    async def load_state(self, game: uuid.UUID) -> Optional[bytes]:
+        return None
+
+    async def save_state(self, game: uuid.UUID, data: bytes):
+        pass
+
+    async def delete_state(self, game: uuid.UUID):
+        pass
+
+    async def mark_logged(self, game: uuid.UUID):
+        self.logged.add(game)
+
+    async def is_logged(self, game: uuid.UUID) -> bool:
+        return game in self.logged
+
+    async def acquire_room(self, game: uuid.UUID) -> str:
+        return WORKER_ID
+
+    async def release_room(self, game: uuid.UUID):
+        pass
+
+    def owns(self, game: uuid.UUID) -> bool:
+        return True
+
+    def publish(self, game: uuid.UUID, kind: str, text: str):
+        pass
+
+    async def quick_join(self, user_id: int, pool: Pool) -> uuid.UUID:
+        return self.lobby.quick_join(user_id, pool)
+
+    async def reserve_seat(self, game: uuid.UUID, user_id: int, pool: Pool) -> bool:
+        return self.lobby.reserve(game, user_id, pool)
+
+    async def has_seat(self, game: uuid.UUID, user_id: int, seated: int) -> bool:
+        return self.lobby.has_seat(game, user_id, seated)
+
+    async def update_public_room(
+        self, game: uuid.UUID, users: Iterable[int], is_open: bool
+    ):
+        self.lobby.update(game, users, is_open)
+
+    async def open_rooms(self, pool: Pool) -> list[dict]:
+        return self.lobby.open_rooms(pool)
+
+    async def public_rooms(self) -> int:
+        return len(self.lobby.rooms)
+
+    async def expire_reservations(self):
+        self.lobby.expire()
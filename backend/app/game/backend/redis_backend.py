@@ -0,0 +1,478 @@
+import asyncio
+import uuid
+from typing import Dict, Iterable, Optional, Set
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from ..game_state import MAX_PLAYERS
+from .base import RoomBackend, BoardHandler, MessageHandler, WORKER_ID
+
+STATE_KEY = "game:{}:state"
+OWNER_KEY = "game:{}:owner"
+# Present while the room may be restored from the game log
+LOGGED_KEY = "game:{}:logged"
+EVENTS_CHANNEL = "game:{}:events"
+EVENTS_PATTERN = "game:*:events"
+# Digest of the board last loaded, and the channel announcing reloads.
+BOARD_KEY = "board:digest"
+BOARD_CHANNEL = "board:reloads"
+
+# Extend or delete the lease only while it still belongs to us.
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Write a room's state only while its lease still belongs to us, and keep
+# knowing the room is in the game log for a while after.
+SAVE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("expire", KEYS[3], ARGV[4])
+    return redis.call("set", KEYS[2], ARGV[2], "EX", ARGV[3])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+# Lobby of public rooms. Per pool a sorted set indexes the open rooms with free
+# seats, scored by free seats and then opening time, so the first member is the
+# fullest room opened first. Per room a hash holds its pool, opening time and
+# whether it takes players, a set the seated users and a sorted set the seat
+# reservations scored by their expiry. Reservations expire lazily, a room is
+# moved to the bucket of its free seats whenever a script touches it.
+LOBBY_POOLS_KEY = "lobby:pools"
+LOBBY_LIST_LIMIT = 100
+
+# Shared by the lobby scripts, ARGV[1] is the TTL of the room keys in seconds
+# and ARGV[2] the reservation time in milliseconds. Keys are derived inside the
+# scripts, which needs a single Redis rather than a cluster.
+LOBBY_FUNCTIONS = """
+local MAX_PLAYERS = %d
+local SLOT = 10000000000000
+local ttl = tonumber(ARGV[1])
+local reservation = tonumber(ARGV[2])
+local clock = redis.call("time")
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local function room_key(game) return "lobby:room:" .. game end
+local function seats_key(game) return "lobby:room:" .. game .. ":seats" end
+local function users_key(game) return "lobby:room:" .. game .. ":users" end
+local function pool_key(pool) return "lobby:pool:" .. pool end
+local function user_key(user) return "lobby:user:" .. user end
+
+local function forget(game, pool)
+    redis.call("del", room_key(game), seats_key(game), users_key(game))
+    redis.call("zrem", pool_key(pool), game)
+end
+
+-- Drops expired reservations and reindexes the room by its free seats.
+-- Returns them, or nil for a room that is not, or no longer, public.
+local function reindex(game)
+    local room = redis.call("hmget", room_key(game), "pool", "opened", "open")
+    local pool = room[1]
+    if not pool then
+        return nil
+    end
+    redis.call("zremrangebyscore", seats_key(game), "-inf", now)
+    local free = MAX_PLAYERS - redis.call("scard", users_key(game))
+        - redis.call("zcard", seats_key(game))
+    if room[3] ~= "1" or free >= MAX_PLAYERS then
+        -- Started, or everybody left or never came.
+        forget(game, pool)
+        return nil
+    end
+    if free <= 0 then
+        redis.call("zrem", pool_key(pool), game)
+    else
+        redis.call("zadd", pool_key(pool), free * SLOT + tonumber(room[2]), game)
+    end
+    redis.call("expire", room_key(game), ttl)
+    redis.call("expire", seats_key(game), ttl)
+    redis.call("expire", users_key(game), ttl)
+    return free
+end
+
+-- A user holds one reservation at a time.
+local function reserve(game, user)
+    local previous = redis.call("get", user_key(user))
+    if previous and previous ~= game then
+        redis.call("zrem", seats_key(previous), user)
+        reindex(previous)
+    end
+    redis.call("zadd", seats_key(game), now + reservation, user)
+    redis.call("set", user_key(user), game, "px", reservation)
+    reindex(game)
+end
+""" % MAX_PLAYERS
+
+# ARGV[3] user, ARGV[4] pool, ARGV[5] id of the room to open if none is free.
+QUICK_JOIN_SCRIPT = LOBBY_FUNCTIONS + """
+local user, pool = ARGV[3], ARGV[4]
+local held = redis.call("get", user_key(user))
+if held then
+    local expires = redis.call("zscore", seats_key(held), user)
+    -- Asking again while holding a seat keeps the same one.
+    local room = redis.call("hmget", room_key(held), "pool", "open")
+    if expires and tonumber(expires) > now and room[1] == pool and room[2] == "1" then
+        reserve(held, user)
+        return held
+    end
+end
+while true do
+    local first = redis.call("zrange", pool_key(pool), 0, 0, "withscores")
+    if #first == 0 then
+        break
+    end
+    local game, score = first[1], tonumber(first[2])
+    local free = reindex(game)
+    if free == nil then
+        redis.call("zrem", pool_key(pool), game)
+    elseif free > 0 and redis.call("zscore", pool_key(pool), game) == first[2] then
+        reserve(game, user)
+        return game
+    end
+    -- Otherwise reservations ran out since it was indexed, look again.
+end
+local game = ARGV[5]
+redis.call("hset", room_key(game), "pool", pool, "opened", now, "open", "1")
+redis.call("sadd", LOBBY_POOLS, pool)
+reserve(game, user)
+return game
+""".replace("LOBBY_POOLS", f'"{LOBBY_POOLS_KEY}"')
+
+# ARGV[3] game, ARGV[4] user, ARGV[5] pool.
+RESERVE_SCRIPT = LOBBY_FUNCTIONS + """
+local game, user, pool = ARGV[3], ARGV[4], ARGV[5]
+if redis.call("hget", room_key(game), "pool") ~= pool then
+    return 0
+end
+local free = reindex(game)
+if free == nil then
+    return 0
+end
+if free <= 0 and not redis.call("zscore", seats_key(game), user)
+    and redis.call("sismember", users_key(game), user) == 0 then
+    return 0
+end
+reserve(game, user)
+return 1
+"""
+
+# ARGV[3] game, ARGV[4] user, ARGV[5] users seated.
+HAS_SEAT_SCRIPT = LOBBY_FUNCTIONS + """
+local game, user, seated = ARGV[3], ARGV[4], tonumber(ARGV[5])
+reindex(game)
+if redis.call("zscore", seats_key(game), user) then
+    return 1
+end
+if seated + redis.call("zcard", seats_key(game)) < MAX_PLAYERS then
+    return 1
+end
+return 0
+"""
+
+# ARGV[3] game, ARGV[4] "1" if it takes players, then the seated users.
+UPDATE_ROOM_SCRIPT = LOBBY_FUNCTIONS + """
+local game = ARGV[3]
+if redis.call("exists", room_key(game)) == 0 then
+    return 0
+end
+redis.call("del", users_key(game))
+for i = 5, #ARGV do
+    redis.call("sadd", users_key(game), ARGV[i])
+    redis.call("zrem", seats_key(game), ARGV[i])
+end
+redis.call("hset", room_key(game), "open", ARGV[4])
+reindex(game)
+return 1
+"""
+
+# ARGV[3] pool, ARGV[4] most rooms listed. Returns game, free seats pairs.
+OPEN_ROOMS_SCRIPT = LOBBY_FUNCTIONS + """
+local pool, limit = ARGV[3], tonumber(ARGV[4])
+local rooms = {}
+for _, game in ipairs(redis.call("zrange", pool_key(pool), 0, limit - 1)) do
+    local free = reindex(game)
+    if free == nil then
+        redis.call("zrem", pool_key(pool), game)
+    elseif free > 0 then
+        table.insert(rooms, game)
+        table.insert(rooms, free)
+    end
+end
+return rooms
+"""
+
+
+def _pool_name(pool: tuple[str, int]) -> str:
+    region, bracket = pool
+    return f"{region}:{bracket}"
+
+
+class RedisRoomBackend(RoomBackend):
+    """
+    Shares rooms between workers through Redis.
+    State is stored as one binary value per room, broadcasts go through a pub/sub
+    channel per room. Any client with the redis.asyncio API can be passed in,
+    e.g. a fakeredis instance in tests.
+
+    Room leases expire after lease_seconds unless renewed, so rooms of a dead
+    worker are taken over by whichever worker the next player connects to.
+    State of owned rooms is written behind, so the owner never waits for Redis.
+
+    The lobby is kept in Redis too, every check and change of a reservation is
+    one Lua script, so they are atomic across workers and take O(log n).
+    """
+
+    shares_state = True
+
+    def __init__(
+        self,
+        client: Redis,
+        state_ttl: int,
+        lease_seconds: int = 15,
+        queue_size: int = 10_000,
+        reservation_seconds: float = 30.0,
+        log_ttl: int = 30 * 24 * 60 * 60,
+    ):
+        self.client = client
+        self.state_ttl = state_ttl
+        self.log_ttl = log_ttl
+        self.lease_ms = lease_seconds * 1000
+        self.reservation_ms = int(reservation_seconds * 1000)
+        self.leases: Set[uuid.UUID] = set()
+        self._dirty: Dict[uuid.UUID, bytes] = {}
+        self._dirty_event = asyncio.Event()
+        self._outgoing: asyncio.Queue[tuple[str, bytes]] = asyncio.Queue(queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self._pubsub = None
+
+    async def start(
+        self, on_message: MessageHandler, on_board: Optional[BoardHandler] = None
+    ):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.psubscribe(EVENTS_PATTERN)
+        if on_board is not None:
+            await self._pubsub.subscribe(BOARD_CHANNEL)
+        self._tasks = [
+            asyncio.create_task(self._listen(on_message, on_board)),
+            asyncio.create_task(self._publisher()),
+            asyncio.create_task(self._state_writer()),
+            asyncio.create_task(self._renew_leases()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._flush_states()
+        for game in list(self.leases):
+            await self.release_room(game)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.client.aclose()
+
+    async def announce_board(self, digest: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(BOARD_KEY, digest)
+            pipe.publish(BOARD_CHANNEL, digest)
+            await pipe.execute()
+
+    async def load_state(self, game: uuid.UUID) -> Optional[bytes]:
+        return await self.client.get(STATE_KEY.format(game))
+
+    async def save_state(self, game: uuid.UUID, data: bytes):
+        if game in self.leases:
+            self._dirty[game] = data
+            self._dirty_event.set()
+        else:
+            await self.client.set(STATE_KEY.format(game), data, ex=self.state_ttl)
+
+    async def delete_state(self, game: uuid.UUID):
+        self._dirty.pop(game, None)
+        await self.client.delete(STATE_KEY.format(game))
+
+    async def mark_logged(self, game: uuid.UUID):
+        await self.client.set(LOGGED_KEY.format(game), 1, ex=self.log_ttl)
+
+    async def is_logged(self, game: uuid.UUID) -> bool:
+        return bool(await self.client.exists(LOGGED_KEY.format(game)))
+
+    async def acquire_room(self, game: uuid.UUID) -> str:
+        key = OWNER_KEY.format(game)
+        while True:
+            if await self.client.set(key, WORKER_ID, nx=True, px=self.lease_ms):
+                self.leases.add(game)
+                return WORKER_ID
+            owner = await self.client.get(key)
+            if owner is not None:
+                # The lease expired between the two calls otherwise, try again.
+                break
+
+        owner = owner.decode("utf-8")
+        if owner == WORKER_ID:
+            self.leases.add(game)
+        else:
+            self.leases.discard(game)
+        return owner
+
+    async def release_room(self, game: uuid.UUID):
+        if game not in self.leases:
+            return
+        data = self._dirty.pop(game, None)
+        if data is not None:
+            await self._save_owned(self.client, game, data)
+        self.leases.discard(game)
+        await self.client.eval(RELEASE_SCRIPT, 1, OWNER_KEY.format(game), WORKER_ID)
+
+    def owns(self, game: uuid.UUID) -> bool:
+        return game in self.leases
+
+    def publish(self, game: uuid.UUID, kind: str, text: str):
+        message = f"{WORKER_ID}|{kind}|{text}".encode("utf-8")
+        try:
+            self._outgoing.put_nowait((EVENTS_CHANNEL.format(game), message))
+        except asyncio.QueueFull:
+            logger.error(f"Redis publish queue is full, dropping frame for game {game}")
+
+    async def _publisher(self):
+        while True:
+            channel, message = await self._outgoing.get()
+            try:
+                await self.client.publish(channel, message)
+            except Exception as e:
+                logger.error(f"Redis publish to {channel} failed: {e!r}")
+
+    async def _flush_states(self):
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for game, data in dirty.items():
+                self._save_owned(pipe, game, data)
+            saved = await pipe.execute()
+        for game, ok in zip(dirty, saved):
+            if not ok:
+                logger.warning(f"Not writing game {game}, its lease is lost")
+
+    def _save_owned(self, client, game: uuid.UUID, data: bytes):
+        return client.eval(
+            SAVE_SCRIPT,
+            3,
+            OWNER_KEY.format(game),
+            STATE_KEY.format(game),
+            LOGGED_KEY.format(game),
+            WORKER_ID,
+            data,
+            self.state_ttl,
+            self.log_ttl,
+        )
+
+    async def _state_writer(self):
+        while True:
+            await self._dirty_event.wait()
+            self._dirty_event.clear()
+            try:
+                await self._flush_states()
+            except Exception as e:
+                logger.error(f"Writing room states to Redis failed: {e!r}")
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_ms / 3000)
+            games = list(self.leases)
+            if not games:
+                continue
+            try:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for game in games:
+                        key = OWNER_KEY.format(game)
+                        pipe.eval(RENEW_SCRIPT, 1, key, WORKER_ID, self.lease_ms)
+                    renewed = await pipe.execute()
+            except Exception as e:
+                logger.error(f"Renewing room leases failed: {e!r}")
+                continue
+            for game, ok in zip(games, renewed):
+                if not ok:
+                    logger.warning(f"Lost the lease of game {game}")
+                    self.leases.discard(game)
+                    # The new owner's state wins over whatever we had pending.
+                    self._dirty.pop(game, None)
+
+    def _lobby(self, script: str, *args):
+        return self.client.eval(script, 0, self.state_ttl, self.reservation_ms, *args)
+
+    async def quick_join(self, user_id: int, pool: tuple[str, int]) -> uuid.UUID:
+        game = await self._lobby(
+            QUICK_JOIN_SCRIPT, user_id, _pool_name(pool), str(uuid.uuid4())
+        )
+        return uuid.UUID(game.decode("utf-8"))
+
+    async def reserve_seat(
+        self, game: uuid.UUID, user_id: int, pool: tuple[str, int]
+    ) -> bool:
+        reserved = await self._lobby(RESERVE_SCRIPT, str(game), user_id, _pool_name(pool))
+        return bool(reserved)
+
+    async def has_seat(self, game: uuid.UUID, user_id: int, seated: int) -> bool:
+        return bool(await self._lobby(HAS_SEAT_SCRIPT, str(game), user_id, seated))
+
+    async def update_public_room(
+        self, game: uuid.UUID, users: Iterable[int], is_open: bool
+    ):
+        await self._lobby(UPDATE_ROOM_SCRIPT, str(game), int(is_open), *users)
+
+    async def open_rooms(self, pool: tuple[str, int]) -> list[dict]:
+        rooms = await self._lobby(OPEN_ROOMS_SCRIPT, _pool_name(pool), LOBBY_LIST_LIMIT)
+        return [
+            {"game": uuid.UUID(game.decode("utf-8")), "free": free}
+            for game, free in zip(rooms[::2], rooms[1::2])
+        ]
+
+    async def public_rooms(self) -> int:
+        pools = await self.client.smembers(LOBBY_POOLS_KEY)
+        if not pools:
+            return 0
+        async with self.client.pipeline(transaction=False) as pipe:
+            for pool in pools:
+                pipe.zcard(f"lobby:pool:{pool.decode('utf-8')}")
+            return sum(await pipe.execute())
+
+    async def _listen(
+        self, on_message: MessageHandler, on_board: Optional[BoardHandler]
+    ):
+        while True:
+            try:
+                if on_board is not None:
+                    # Reloads announced while we were not listening are missed,
+                    # the last digest is checked every time listening starts.
+                    digest = await self.client.get(BOARD_KEY)
+                    if digest is not None:
+                        await on_board(digest.decode("utf-8"))
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        await on_board(message["data"].decode("utf-8"))
+                        continue
+                    if message["type"] != "pmessage":
+                        continue
+                    origin, kind, text = message["data"].decode("utf-8").split("|", 2)
+                    if origin == WORKER_ID:
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    on_message(uuid.UUID(channel.split(":")[1]), kind, text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis subscription failed, resubscribing: {e!r}")
+                await asyncio.sleep(1)
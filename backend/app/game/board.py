@@ -0,0 +1,107 @@
+import hashlib
+import json
+from typing import Optional, Sequence
+
+import msgpack
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.database import db_helper
+from app.database.models import ChanceCommand, Tile, Property
+from .engine import BoardTables
+
+
+class BoardSnapshot:
+    """
+    Read-only view of the board shared by every game room.
+    Holds the typed tiles together with their JSON and msgpack encodings and the
+    rule tables with the compiled card decks, so rooms never query, serialize or
+    re-derive the board themselves.
+
+    The version only counts refreshes of this process, the digest of the tiles
+    and cards identifies the board across workers and restarts.
+    """
+
+    __slots__ = (
+        "version",
+        "tiles",
+        "size",
+        "payload",
+        "text",
+        "packed",
+        "tables",
+        "digest",
+    )
+
+    def __init__(
+        self, version: int, tiles: Sequence[Tile], cards: Sequence[ChanceCommand] = ()
+    ):
+        self.version = version
+        self.tiles: tuple[Tile, ...] = tuple(tiles)
+        # Number of board positions, per-tile game state is indexed by Tile.index.
+        self.size: int = max((tile.index for tile in self.tiles), default=-1) + 1
+        encoded = jsonable_encoder(self.tiles)
+        self.payload: bytes = json.dumps(encoded, separators=(",", ":")).encode("utf-8")
+        self.text: str = self.payload.decode("utf-8")
+        self.packed: bytes = msgpack.packb(encoded)
+        self.tables = BoardTables.from_tiles(self.tiles, cards)
+        digest = hashlib.blake2b(self.payload, digest_size=8)
+        for card in cards:
+            digest.update(f"\0{card.type.value}\0{card.command}".encode("utf-8"))
+        self.digest: str = digest.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+
+async def fetch_tiles(session: AsyncSession) -> Sequence[Tile]:
+    query = (
+        select(Tile)
+        .options(
+            joinedload(Tile.property).joinedload(Property.group),
+            joinedload(Tile.railway),
+            joinedload(Tile.company),
+            joinedload(Tile.special),
+        )
+        .order_by(Tile.index)
+    )
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+async def fetch_cards(session: AsyncSession) -> Sequence[ChanceCommand]:
+    result = await session.execute(select(ChanceCommand).order_by(ChanceCommand.id))
+    return result.scalars().all()
+
+
+class BoardCache:
+    def __init__(self):
+        self._snapshot: Optional[BoardSnapshot] = None
+        self._version = 0
+
+    @property
+    def snapshot(self) -> BoardSnapshot:
+        """Returns the current board, the reference is replaced as a whole on refresh."""
+        if self._snapshot is None:
+            raise RuntimeError("Board cache is not loaded")
+        return self._snapshot
+
+    async def refresh(self) -> BoardSnapshot:
+        """Reads the board from the database and swaps in a new snapshot."""
+        async with db_helper.get_scoped_session()() as session:
+            tiles = await fetch_tiles(session)
+            cards = await fetch_cards(session)
+
+        self._version += 1
+        self._snapshot = BoardSnapshot(self._version, tiles, cards)
+        logger.info(
+            f"Board snapshot v{self._version} loaded: {len(self._snapshot)} tiles, "
+            f"{len(cards)} cards, {len(self._snapshot.payload)} bytes"
+        )
+        return self._snapshot
+
+
+board_cache = BoardCache()
@@ -0,0 +1,170 @@
+"""
+The raw board description in app.game.data turned into plain rows.
+
+Nothing here touches the database, so the rules, the Markov model and the
+simulator can build a board from the data files alone. Tile and special types
+are the values of TileTypeEnum and SpecialTypeEnum, game_data_loader maps the
+rows onto the models.
+"""
+
+
+GROUP_COLOR_MAPPING = {
+    "Brown": "#8B4513",
+    "Light Blue": "#ADD8E6",
+    "Pink": "#FFC0CB",
+    "Orange": "#FFA500",
+    "Red": "#FF0000",
+    "Yellow": "#FFFF00",
+    "Green": "#008000",
+    "Dark Blue": "#00008B",
+    "Railroad": "#808080",
+    "Utility": "#D3D3D3",
+}
+
+
+def get_tile_type(tile_data: dict) -> str | None:
+    if tile_data.get("property") is not None:
+        return "property"
+    if tile_data.get("railway") is not None:
+        return "railway"
+    if tile_data.get("utility") is not None:
+        return "company"
+    if tile_data.get("special_tile") is not None:
+        return "special"
+    return None
+
+
+def get_special_type(tile_name: str) -> str:
+    if tile_name == "Go":
+        return "go"
+    if tile_name == "Jail/Just Visiting":
+        return "jail"
+    if tile_name == "Go To Jail":
+        return "goto_jail"
+    if tile_name in ("Income Tax", "Luxury Tax"):
+        return "tax"
+    if "Community Chest" in tile_name:
+        return "chest"
+    if "Chance" in tile_name:
+        return "chance"
+    if tile_name == "Casino":
+        return "casino"
+    return "go"
+
+
+def parse_tiles(
+    data: list[dict],
+) -> tuple[dict[int, dict], list[dict], dict[str, list[dict]]]:
+    """
+    Converts the raw board description into insertable rows.
+    Returns groups keyed by their JSON id, the tile rows and, per subtype name,
+    the subtype rows. Subtype rows reference their tile by position in the tile
+    rows ("tile_id") and properties reference their group by JSON id ("group_id"),
+    both are replaced with database ids once the parents are inserted.
+    """
+    groups: dict[int, dict] = {}
+    tile_rows: list[dict] = []
+    subtype_rows: dict[str, list[dict]] = {
+        "property": [],
+        "railway": [],
+        "company": [],
+        "special": [],
+    }
+
+    for tile_data in data:
+        tile_type = get_tile_type(tile_data)
+        if tile_type is None:
+            continue
+
+        tile_name = tile_data["name"]
+        tile_pos = len(tile_rows)
+        tile_rows.append({"index": tile_data["tile_position"], "type": tile_type})
+
+        if tile_type == "property":
+            prop_data = tile_data["property"]
+            group_info = tile_data.get("group")
+            group_json_id = None
+            if group_info:
+                group_json_id = group_info["id"]
+                if group_json_id not in groups:
+                    group_name = group_info["name"]
+                    groups[group_json_id] = {
+                        "name": group_name,
+                        "color": GROUP_COLOR_MAPPING.get(group_name, "#000000"),
+                        "property_count": 0,
+                    }
+                groups[group_json_id]["property_count"] += 1
+
+            # For properties we map:
+            # • JSON "base_rent" → rent_0_house,
+            # • "one_house_rent" → rent_1_house,
+            # • "two_houses_rent" → rent_2_house, etc.
+            # For mortgage we use a simple default (half the price).
+            # For hotel_price we use house_price as a placeholder.
+            house_price = prop_data["house_price"]
+            price = prop_data["price"]
+            subtype_rows["property"].append(
+                {
+                    "tile_id": tile_pos,
+                    "group_id": group_json_id,
+                    "name": tile_name,
+                    "description": "",
+                    "price": price,
+                    "mortgage": price / 2,
+                    "house_price": house_price,
+                    "hotel_price": house_price,  # placeholder value
+                    "rent_0_house": prop_data["base_rent"],
+                    "rent_1_house": prop_data["one_house_rent"],
+                    "rent_2_house": prop_data["two_houses_rent"],
+                    "rent_3_house": prop_data["three_houses_rent"],
+                    "rent_4_house": prop_data["four_houses_rent"],
+                    "rent_hotel": prop_data["hotel_rent"],
+                }
+            )
+
+        elif tile_type == "railway":
+            rail_data = tile_data["railway"]
+            price = rail_data["price"]
+            subtype_rows["railway"].append(
+                {
+                    "tile_id": tile_pos,
+                    "name": tile_name,
+                    "description": "",
+                    "price": price,
+                    "mortgage": price / 2,
+                    "rent_1": rail_data["one_owned_rent"],
+                    "rent_2": rail_data["two_owned_rent"],
+                    "rent_3": rail_data["three_owned_rent"],
+                    "rent_4": rail_data["four_owned_rent"],
+                }
+            )
+
+        elif tile_type == "company":
+            # Here we treat a utility tile as a "company" tile.
+            util_data = tile_data["utility"]
+            price = util_data["price"]
+            # Map the multipliers into the two rent fields.
+            subtype_rows["company"].append(
+                {
+                    "tile_id": tile_pos,
+                    "name": tile_name,
+                    "description": "",
+                    "price": price,
+                    "mortgage": price / 2,
+                    "rent_1": util_data["one_company_owned_multiplier"],
+                    "rent_2": util_data["two_companies_owned_multiplier"],
+                }
+            )
+
+        elif tile_type == "special":
+            subtype_rows["special"].append(
+                {"tile_id": tile_pos, "type": get_special_type(tile_name)}
+            )
+
+    return groups, tile_rows, subtype_rows
+
+
+def board_size(data: list[dict]) -> int:
+    """Number of board positions, as BoardTables counts them."""
+    positions = [tile["tile_position"] for tile in data if get_tile_type(tile) is not None]
+    return max(positions, default=-1) + 1
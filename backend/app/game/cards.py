@@ -0,0 +1,109 @@
+"""
+Chance and Community Chest cards.
+
+The command of a card is a short text such as "advance 24", "collect 50" or
+"repairs 25 100". Commands are compiled into Card objects once, when the board
+is loaded, so drawing a card during a game is an array read and a branch on
+its opcode.
+
+    advance <tile>              move forward to the tile, passing Go pays
+    nearest railway|utility     move forward to the next tile of that kind
+    back <steps>                move back, never passing Go
+    jail                        go straight to jail
+    collect <amount>            the bank pays the player
+    pay <amount>                the player pays the bank
+    collect_each <amount>       every other player pays the player
+    pay_each <amount>           the player pays every other player
+    repairs <house> <hotel>     the player pays per house and per hotel owned
+"""
+
+from typing import Iterable, Tuple
+
+from .engine import (
+    ADVANCE,
+    BACK,
+    BANK,
+    DECKS,
+    GO_TO_JAIL,
+    NEAREST,
+    PLAYERS,
+    RAILWAY,
+    REPAIRS,
+    UTILITY,
+)
+
+NEAREST_KINDS = {"railway": RAILWAY, "utility": UTILITY}
+
+
+class Card:
+    __slots__ = ("description", "op", "args")
+
+    def __init__(self, description: str, op: int, args: Tuple[int, ...]):
+        self.description = description
+        self.op = op
+        self.args = args
+
+    def __repr__(self) -> str:
+        return f"Card({self.description!r}, {self.op}, {self.args})"
+
+
+def _amount(word: str) -> int:
+    value = int(word)
+    if value < 0:
+        raise ValueError(f"Negative amount {word!r}")
+    return value
+
+
+def _tile(word: str, size: int) -> int:
+    tile = int(word)
+    if not 0 <= tile < size:
+        raise ValueError(f"Tile {word!r} is not on a board of {size} tiles")
+    return tile
+
+
+def compile_command(command: str, size: int) -> Tuple[int, Tuple[int, ...]]:
+    """
+    Parses a command for a board of size tiles into its opcode and arguments,
+    raises ValueError if invalid.
+    """
+    match command.split():
+        case ["advance", tile]:
+            return ADVANCE, (_tile(tile, size),)
+        case ["nearest", kind] if kind in NEAREST_KINDS:
+            return NEAREST, (NEAREST_KINDS[kind],)
+        case ["back", steps]:
+            return BACK, (_amount(steps),)
+        case ["jail"]:
+            return GO_TO_JAIL, ()
+        case ["collect", amount]:
+            return BANK, (_amount(amount),)
+        case ["pay", amount]:
+            return BANK, (-_amount(amount),)
+        case ["collect_each", amount]:
+            return PLAYERS, (_amount(amount),)
+        case ["pay_each", amount]:
+            return PLAYERS, (-_amount(amount),)
+        case ["repairs", per_house, per_hotel]:
+            return REPAIRS, (_amount(per_house), _amount(per_hotel))
+    raise ValueError(f"Unknown card command {command!r}")
+
+
+def compile_card(description: str, command: str, size: int) -> Card:
+    op, args = compile_command(command, size)
+    return Card(description, op, args)
+
+
+def compile_decks(cards: Iterable, size: int) -> Tuple[Tuple[Card, ...], ...]:
+    """
+    Sorts ChanceCommand rows, or anything with the same attributes, into the
+    decks compiled for a board of size tiles, in DECKS order. Rows of other
+    types are left out.
+    """
+    decks: dict[str, list[Card]] = {name: [] for name in DECKS}
+    for card in cards:
+        card_type = getattr(card.type, "value", card.type)
+        if card_type in decks:
+            decks[card_type].append(compile_card(card.description, card.command, size))
+    if any(len(deck) > 255 for deck in decks.values()):
+        raise ValueError("Decks are limited to 255 cards")
+    return tuple(tuple(decks[name]) for name in DECKS)
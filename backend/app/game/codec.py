@@ -0,0 +1,108 @@
+import enum
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+import msgpack
+from fastapi import WebSocket
+
+Encoded = Union[str, bytes]
+
+
+class Encoding(enum.Enum):
+    # Text frames, readable in the browser devtools.
+    json = "json"
+    # Binary frames, smaller and cheaper to build and to parse.
+    msgpack = "msgpack"
+
+
+# WebSocket subprotocols a client may offer, in our order of preference.
+SUBPROTOCOLS = {
+    "monopoly.msgpack": Encoding.msgpack,
+    "monopoly.json": Encoding.json,
+}
+
+
+def negotiate(websocket: WebSocket) -> Tuple[Encoding, Optional[str]]:
+    """Picks the encoding from the offered subprotocols, JSON if none matches."""
+    offered = websocket.scope.get("subprotocols") or ()
+    for subprotocol, encoding in SUBPROTOCOLS.items():
+        if subprotocol in offered:
+            return encoding, subprotocol
+    return Encoding.json, None
+
+
+def encode(data, encoding: Encoding) -> Encoded:
+    if encoding is Encoding.msgpack:
+        return msgpack.packb(data)
+    # Same as WebSocket.send_json
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(frame: Encoded) -> Any:
+    """Clients may send either kind of frame whatever they receive."""
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame)
+    return json.loads(frame)
+
+
+def envelope(
+    content: Encoded, message_type: str, timestamp: int, encoding: Encoding
+) -> Encoded:
+    """
+    Wraps already encoded content into the {"content", "type", "timestamp"}
+    envelope without decoding it again.
+    """
+    if encoding is Encoding.msgpack:
+        return b"".join(
+            (
+                b"\x83",  # fixmap of 3 entries
+                msgpack.packb("content"),
+                content,
+                msgpack.packb("type"),
+                msgpack.packb(message_type),
+                msgpack.packb("timestamp"),
+                msgpack.packb(timestamp),
+            )
+        )
+    return (
+        f'{{"content":{content},"type":"{message_type}","timestamp":{timestamp}}}'
+    )
+
+
+def batch(frames: list[Encoded]) -> Encoded:
+    """
+    Joins encoded messages of one connection into a single array frame by
+    concatenation, the messages themselves are not encoded again.
+    """
+    if isinstance(frames[0], bytes):
+        count = len(frames)
+        if count < 16:
+            header = bytes((0x90 | count,))  # fixarray
+        else:
+            header = b"\xdc" + count.to_bytes(2, "big")  # array 16
+        return header + b"".join(frames)
+    return "[" + ",".join(frames) + "]"
+
+
+class Message:
+    """A message going to many sockets, encoded at most once per encoding."""
+
+    __slots__ = ("_data", "_encoded")
+
+    def __init__(self, data=None, json_text: Optional[str] = None):
+        self._data = data
+        self._encoded: Dict[Encoding, Encoded] = {}
+        if json_text is not None:
+            self._encoded[Encoding.json] = json_text
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self._encoded[Encoding.json])
+        return self._data
+
+    def encoded(self, encoding: Encoding) -> Encoded:
+        frame = self._encoded.get(encoding)
+        if frame is None:
+            frame = self._encoded[encoding] = encode(self.data, encoding)
+        return frame
@@ -1,41 +1,218 @@
+import asyncio
 import uuid
-from typing import List, Dict
-from fastapi import WebSocket
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Optional, Set
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+
+from app.settings import settings
+from .backend import BoardHandler, RoomBackend, MemoryRoomBackend
+from .codec import Encoded, Encoding, Message, batch, decode, encode, negotiate
+from .outbox import Outbox, OutboxOverflow, OverflowPolicy, FrameKind
+
+
+class Connection:
+    """
+    A WebSocket together with the encoding it negotiated, its outbound queue
+    and the task writing it.
+    """
+
+    __slots__ = ("game", "websocket", "encoding", "outbox", "writer")
+
+    def __init__(
+        self,
+        game: uuid.UUID,
+        websocket: WebSocket,
+        encoding: Encoding,
+        outbox: Outbox,
+    ):
+        self.game = game
+        self.websocket = websocket
+        self.encoding = encoding
+        self.outbox = outbox
+        self.writer: Optional[asyncio.Task] = None
 
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, backend: Optional[RoomBackend] = None):
         # Dictionary mapping room names to a list of WebSocket connections.
         self.active_connections: Dict[uuid.UUID, List[WebSocket]] = {}
+        self.connections: Dict[WebSocket, Connection] = {}
+        self._closing: Set[asyncio.Task] = set()
+        # Frames of rooms in the middle of a command, sent when it is done.
+        self._held: Dict[uuid.UUID, Dict[Connection, List[tuple[Encoded, FrameKind]]]] = {}
+        self.backend = backend or MemoryRoomBackend()
+
+    async def start(self, on_board: Optional[BoardHandler] = None):
+        await self.backend.start(self._deliver, on_board)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def _deliver(self, game: uuid.UUID, kind: str, text: str):
+        """Hand a frame broadcast by another worker to our sockets in the room."""
+        self._fan_out(game, Message(json_text=text), FrameKind(kind))
 
     async def _connect(self, game: uuid.UUID, websocket: WebSocket):
         """Accept a new WebSocket connection and add it to the specified room."""
-        await websocket.accept()
+        encoding, subprotocol = negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         if game not in self.active_connections:
             self.active_connections[game] = []
         self.active_connections[game].append(websocket)
 
+        connection = Connection(
+            game,
+            websocket,
+            encoding,
+            Outbox(settings.WS_QUEUE_SIZE, OverflowPolicy(settings.WS_OVERFLOW_POLICY)),
+        )
+        connection.writer = asyncio.create_task(self._writer(connection))
+        self.connections[websocket] = connection
+
     def _disconnect(self, game: uuid.UUID, websocket: WebSocket):
         """Remove a WebSocket connection from a room."""
-        if game in self.active_connections:
-            self.active_connections[game].remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+        connections = self.active_connections.get(game)
+        # The connection may already be gone if it was evicted as too slow.
+        if connections is not None and websocket in connections:
+            connections.remove(websocket)
             # Optionally, remove the room if empty
-            if not self.active_connections[game]:
+            if not connections:
                 del self.active_connections[game]
 
-    async def send_personal_message(self, data, websocket: WebSocket):
+    def _evict(self, game: uuid.UUID, websocket: WebSocket):
+        """Drop a slow or dead connection and close it in the background."""
+        self._disconnect(game, websocket)
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=1011), timeout=settings.WS_SEND_TIMEOUT
+            )
+        except Exception:
+            pass
+
+    async def _writer(self, connection: Connection):
+        """Write queued frames to the socket, so senders never wait on the network."""
+        try:
+            while True:
+                frame = await connection.outbox.get()
+                if settings.WS_BATCH_FRAMES:
+                    frame = await self._collect(connection, frame)
+                send = (
+                    connection.websocket.send_bytes
+                    if isinstance(frame, bytes)
+                    else connection.websocket.send_text
+                )
+                await asyncio.wait_for(send(frame), timeout=settings.WS_SEND_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Evicting connection from game {connection.game}: {e!r}")
+            self._evict(connection.game, connection.websocket)
+
+    async def _collect(self, connection: Connection, frame: Encoded) -> Encoded:
+        """Waits out the batching window and joins what was queued meanwhile."""
+        await asyncio.sleep(settings.WS_BATCH_WINDOW)
+        frames = connection.outbox.drain(settings.WS_BATCH_MAX_FRAMES - 1)
+        if not frames:
+            return frame
+        return batch([frame, *frames])
+
+    def hold(self, game: uuid.UUID):
+        """Keeps the frames sent to the room until flush."""
+        self._held.setdefault(game, {})
+
+    def flush(self, game: uuid.UUID):
+        """
+        Queues what was held for the room, consecutive frames of the same kind
+        as one array frame. Kinds are never mixed in a batch, so the outbox can
+        still coalesce state frames and drop chat frames on overflow.
+        """
+        for connection, frames in self._held.pop(game, {}).items():
+            if self.connections.get(connection.websocket) is not connection:
+                continue
+            for kind, run in groupby(frames, key=itemgetter(1)):
+                run = [frame for frame, _ in run]
+                self._enqueue(connection, run[0] if len(run) == 1 else batch(run), kind)
+
+    def _enqueue(
+        self, connection: Connection, frame: Encoded, kind: FrameKind = FrameKind.event
+    ):
+        held = self._held.get(connection.game)
+        if held is not None:
+            held.setdefault(connection, []).append((frame, kind))
+            return
+        try:
+            connection.outbox.put(frame, kind)
+        except OutboxOverflow as e:
+            logger.warning(f"Evicting connection from game {connection.game}: {e}")
+            self._evict(connection.game, connection.websocket)
+
+    def encoding(self, websocket: WebSocket) -> Encoding:
+        connection = self.connections.get(websocket)
+        return connection.encoding if connection is not None else Encoding.json
+
+    async def receive(self, websocket: WebSocket):
+        """Receive and decode one message, text frames as JSON, binary as msgpack."""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        frame = message.get("bytes")
+        return decode(frame if frame is not None else message["text"])
+
+    async def send_personal_message(
+        self, data, websocket: WebSocket, kind: FrameKind = FrameKind.event
+    ):
         """Send a message to a single WebSocket connection."""
-        await websocket.send_json(data)
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, encode(data, connection.encoding), kind)
+
+    async def send_personal_frame(
+        self, frame: Encoded, websocket: WebSocket, kind: FrameKind = FrameKind.event
+    ):
+        """Send a message already encoded for the connection's encoding."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, frame, kind)
+
+    def _fan_out(
+        self,
+        game: uuid.UUID,
+        message: Message,
+        kind: FrameKind,
+        exclude: Optional[WebSocket] = None,
+    ):
+        """Queue a message for every connection in a room, encoded once per encoding."""
+        for websocket in list(self.active_connections.get(game, ())):
+            connection = self.connections.get(websocket)
+            if connection is not None and websocket is not exclude:
+                self._enqueue(connection, message.encoded(connection.encoding), kind)
 
-    async def broadcast(self, game: uuid.UUID, data):
+    async def broadcast(
+        self, game: uuid.UUID, data, kind: FrameKind = FrameKind.event
+    ):
         """Broadcast a message to all connections in a room."""
-        if game in self.active_connections:
-            for connection in self.active_connections[game]:
-                await connection.send_json(data)
+        message = Message(data)
+        self._fan_out(game, message, kind)
+        self.backend.publish(game, kind.value, message.encoded(Encoding.json))
 
-    async def broadcast_except_sender(self, game: uuid.UUID, data, sender: WebSocket):
+    async def broadcast_except_sender(
+        self,
+        game: uuid.UUID,
+        data,
+        sender: WebSocket,
+        kind: FrameKind = FrameKind.event,
+    ):
         """Broadcast a message to all connections in a room except the sender."""
-        if game in self.active_connections:
-            for connection in self.active_connections[game]:
-                if connection != sender:
-                    await connection.send_json(data)
+        message = Message(data)
+        self._fan_out(game, message, kind, exclude=sender)
+        # The sender is always local, other workers deliver to everyone.
+        self.backend.publish(game, kind.value, message.encoded(Encoding.json))
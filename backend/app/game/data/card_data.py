@@ -1,2 +1,153 @@
-# TODO: Add cards
-cards = [...]
+# Commands are compiled by app.game.cards, see its docstring for the syntax.
+cards = [
+    {
+        "type": "chance",
+        "description": "Advance to Go (Collect $200)",
+        "command": "advance 0",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to Illinois Avenue. If you pass Go, collect $200",
+        "command": "advance 24",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to St. Charles Place. If you pass Go, collect $200",
+        "command": "advance 11",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to the nearest Utility",
+        "command": "nearest utility",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to the nearest Railroad",
+        "command": "nearest railway",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to the nearest Railroad",
+        "command": "nearest railway",
+    },
+    {
+        "type": "chance",
+        "description": "Bank pays you dividend of $50",
+        "command": "collect 50",
+    },
+    {
+        "type": "chance",
+        "description": "Go Back 3 Spaces",
+        "command": "back 3",
+    },
+    {
+        "type": "chance",
+        "description": "Go to Jail. Go directly to Jail, do not pass Go, do not collect $200",
+        "command": "jail",
+    },
+    {
+        "type": "chance",
+        "description": "Make general repairs on all your property. For each house pay $25. For each hotel pay $100",
+        "command": "repairs 25 100",
+    },
+    {
+        "type": "chance",
+        "description": "Speeding fine $15",
+        "command": "pay 15",
+    },
+    {
+        "type": "chance",
+        "description": "Take a trip to Reading Railroad. If you pass Go, collect $200",
+        "command": "advance 5",
+    },
+    {
+        "type": "chance",
+        "description": "Advance to Boardwalk",
+        "command": "advance 39",
+    },
+    {
+        "type": "chance",
+        "description": "You have been elected Chairman of the Board. Pay each player $50",
+        "command": "pay_each 50",
+    },
+    {
+        "type": "chance",
+        "description": "Your building loan matures. Collect $150",
+        "command": "collect 150",
+    },
+    {
+        "type": "chest",
+        "description": "Advance to Go (Collect $200)",
+        "command": "advance 0",
+    },
+    {
+        "type": "chest",
+        "description": "Bank error in your favor. Collect $200",
+        "command": "collect 200",
+    },
+    {
+        "type": "chest",
+        "description": "Doctor's fee. Pay $50",
+        "command": "pay 50",
+    },
+    {
+        "type": "chest",
+        "description": "From sale of stock you get $50",
+        "command": "collect 50",
+    },
+    {
+        "type": "chest",
+        "description": "Go to Jail. Go directly to jail, do not pass Go, do not collect $200",
+        "command": "jail",
+    },
+    {
+        "type": "chest",
+        "description": "Holiday fund matures. Receive $100",
+        "command": "collect 100",
+    },
+    {
+        "type": "chest",
+        "description": "Income tax refund. Collect $20",
+        "command": "collect 20",
+    },
+    {
+        "type": "chest",
+        "description": "It is your birthday. Collect $10 from every player",
+        "command": "collect_each 10",
+    },
+    {
+        "type": "chest",
+        "description": "Life insurance matures. Collect $100",
+        "command": "collect 100",
+    },
+    {
+        "type": "chest",
+        "description": "Pay hospital fees of $100",
+        "command": "pay 100",
+    },
+    {
+        "type": "chest",
+        "description": "Pay school fees of $50",
+        "command": "pay 50",
+    },
+    {
+        "type": "chest",
+        "description": "Receive $25 consultancy fee",
+        "command": "collect 25",
+    },
+    {
+        "type": "chest",
+        "description": "You are assessed for street repairs. $40 per house. $115 per hotel",
+        "command": "repairs 40 115",
+    },
+    {
+        "type": "chest",
+        "description": "You have won second prize in a beauty contest. Collect $10",
+        "command": "collect 10",
+    },
+    {
+        "type": "chest",
+        "description": "You inherit $100",
+        "command": "collect 100",
+    },
+]
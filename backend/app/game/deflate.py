@@ -0,0 +1,70 @@
+"""
+permessage-deflate that leaves small messages uncompressed.
+
+Compressing a frame of a few dozen bytes costs more CPU than it saves and can
+even grow it, while the board payload shrinks to a fraction of its size. RFC
+7692 lets the sender decide per message, uncompressed messages are simply sent
+without the RSV1 bit.
+"""
+
+from functools import partial
+
+from loguru import logger
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import Frame, Opcode
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    def __init__(self, *args, threshold: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def encode(self, frame: Frame) -> Frame:
+        if (
+            frame.opcode in (Opcode.TEXT, Opcode.BINARY)
+            and frame.fin
+            and len(frame.data) < self.threshold
+        ):
+            return frame
+        return super().encode(frame)
+
+
+class ThresholdPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, threshold: int, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(
+            params, accepted_extensions
+        )
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            self.compress_settings,
+            threshold=self.threshold,
+        )
+
+
+def install(threshold: int):
+    """
+    Makes uvicorn's websockets protocol negotiate the threshold extension.
+    uvicorn builds its extension list per connection from this module global,
+    and has already imported its protocol by the time the app is imported.
+    Whether deflate is offered at all is still uvicorn's --ws-per-message-deflate.
+    """
+    if threshold <= 0:
+        return
+    try:
+        from uvicorn.protocols.websockets import websockets_impl
+    except ImportError:
+        return
+    websockets_impl.ServerPerMessageDeflateFactory = partial(
+        ThresholdPerMessageDeflateFactory, threshold
+    )
+    logger.info(f"WebSocket frames under {threshold} bytes are sent uncompressed")
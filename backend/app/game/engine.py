@@ -0,0 +1,606 @@
+"""
+Rules of the game as pure functions over a GameState.
+
+Nothing here awaits, talks to the database or to sockets, so the same code runs
+inside GameManager and in batch simulations. Dice are passed in by the caller,
+which keeps every action deterministic and replayable.
+
+Each action returns the list of events it caused. Events are plain tuples whose
+first item names the change, e.g. ("move", seat, from_tile, to_tile).
+"""
+
+import random
+from array import array
+from types import SimpleNamespace
+from typing import List, Sequence
+
+from .game_state import (
+    GameState,
+    GameStatus,
+    MAX_PLAYERS,
+    NO_OWNER,
+    STARTING_BALANCE,
+)
+
+GO_SALARY = 200
+JAIL_FINE = 50
+MAX_JAIL_TURNS = 3
+MAX_DOUBLES = 3
+MAX_HOUSES = 5  # the fifth "house" is the hotel
+INCOME_TAX = 200
+LUXURY_TAX = 100
+
+# Tile kinds
+PROPERTY = 0
+RAILWAY = 1
+UTILITY = 2
+GO = 3
+TAX = 4
+JAIL = 5
+GOTO_JAIL = 6
+CHANCE = 7
+CHEST = 8
+FREE = 9
+
+SPECIAL_KINDS = {
+    "go": GO,
+    "tax": TAX,
+    "jail": JAIL,
+    "goto_jail": GOTO_JAIL,
+    "chance": CHANCE,
+    "chest": CHEST,
+    "casino": FREE,
+}
+
+# Width of a row in BoardTables.rent
+RENT_SLOTS = MAX_HOUSES + 1
+
+# Card opcodes, see cards.compile_command for the commands they come from.
+ADVANCE = 0  # (tile,) move forward to the tile
+NEAREST = 1  # (kind,) move forward to the next tile of that kind
+BACK = 2  # (steps,) move back, never passing Go
+GO_TO_JAIL = 3  # ()
+BANK = 4  # (amount,) collect from the bank, or pay it when negative
+PLAYERS = 5  # (amount,) collect from every other player, or pay each of them
+REPAIRS = 6  # (per_house, per_hotel) pay for every building owned
+
+# Decks by index in BoardTables.decks, the index is the tile kind minus CHANCE.
+DECKS = ("chance", "chest")
+
+Event = tuple
+
+
+class GameRuleError(Exception):
+    pass
+
+
+class BoardTables:
+    """
+    Per-tile lookup tables derived once from a board, so that resolving a move,
+    rent or purchase is a handful of array reads.
+
+    rent holds RENT_SLOTS values per tile: rent by house count for properties,
+    rent by number of railways owned for railways and the dice multiplier by
+    number of utilities owned for utilities. Every tile belongs to a group, the
+    bitmask of a group's tiles tells whether a player owns all of them.
+    """
+
+    __slots__ = (
+        "size",
+        "kind",
+        "price",
+        "mortgage",
+        "house_price",
+        "rent",
+        "tax",
+        "group",
+        "group_masks",
+        "jail",
+        "decks",
+        "deck_offsets",
+    )
+
+    def __init__(self, tiles: Sequence, decks: Sequence[Sequence] = ((), ())):
+        if not tiles:
+            raise ValueError("Board has no tiles")
+        size = max(tile.index for tile in tiles) + 1
+        if size > 64:
+            raise ValueError("Boards are limited to 64 tiles")
+
+        self.size = size
+        self.kind = bytearray([FREE]) * size
+        self.price = array("i", [0]) * size
+        self.mortgage = array("i", [0]) * size
+        self.house_price = array("i", [0]) * size
+        self.rent = array("i", [0]) * (size * RENT_SLOTS)
+        self.tax = array("i", [0]) * size
+        self.group = array("b", [-1]) * size
+        self.jail = 0
+
+        group_ids: dict = {}
+        masks: List[int] = []
+
+        def add_to_group(key, index: int):
+            if key not in group_ids:
+                group_ids[key] = len(masks)
+                masks.append(0)
+            self.group[index] = group_ids[key]
+            masks[group_ids[key]] |= 1 << index
+
+        for tile in sorted(tiles, key=lambda t: t.index):
+            index = tile.index
+            row = index * RENT_SLOTS
+            tile_type = getattr(tile.type, "value", tile.type)
+
+            if tile_type == "property":
+                prop = tile.property
+                self.kind[index] = PROPERTY
+                self.price[index] = int(prop.price)
+                self.mortgage[index] = int(prop.mortgage)
+                self.house_price[index] = int(prop.house_price)
+                rents = (
+                    prop.rent_0_house,
+                    prop.rent_1_house,
+                    prop.rent_2_house,
+                    prop.rent_3_house,
+                    prop.rent_4_house,
+                    prop.rent_hotel,
+                )
+                self.rent[row : row + RENT_SLOTS] = array("i", map(int, rents))
+                add_to_group(("property", prop.group_id), index)
+
+            elif tile_type in ("railway", "company"):
+                owned = tile.railway if tile_type == "railway" else tile.company
+                self.kind[index] = RAILWAY if tile_type == "railway" else UTILITY
+                self.price[index] = int(owned.price)
+                self.mortgage[index] = int(owned.mortgage)
+                rents = [owned.rent_1, owned.rent_2]
+                if tile_type == "railway":
+                    rents += [owned.rent_3, owned.rent_4]
+                for i, value in enumerate(rents):
+                    self.rent[row + i] = int(value)
+                add_to_group(tile_type, index)
+
+            elif tile_type == "special":
+                special_type = getattr(tile.special.type, "value", tile.special.type)
+                kind = SPECIAL_KINDS.get(special_type, FREE)
+                self.kind[index] = kind
+                if kind == TAX:
+                    # Income tax on the first half of the board, luxury tax after.
+                    self.tax[index] = INCOME_TAX if index < size // 2 else LUXURY_TAX
+                elif kind == JAIL:
+                    self.jail = index
+
+        self.group_masks = tuple(masks)
+
+        # Compiled cards per deck, a game keeps its shuffled order of each deck
+        # in one array, deck_offsets tell where each deck starts in it.
+        self.decks = tuple(tuple(deck) for deck in decks)
+        self.deck_offsets = (0, len(self.decks[0]))
+
+    @classmethod
+    def from_tiles(cls, tiles: Sequence, cards: Sequence = ()) -> "BoardTables":
+        """Builds the tables from Tile and ChanceCommand models."""
+        from .cards import compile_decks
+
+        size = max((tile.index for tile in tiles), default=-1) + 1
+        return cls(tiles, compile_decks(cards, size))
+
+    @classmethod
+    def from_data(cls, data: list[dict], cards: Sequence[dict] = ()) -> "BoardTables":
+        """
+        Builds the tables straight from a raw board and card list such as
+        game.data.tiles and game.data.cards.
+        """
+        from .cards import compile_decks
+        from .board_data import parse_tiles
+
+        _, tile_rows, subtype_rows = parse_tiles(data)
+        tiles = [
+            SimpleNamespace(
+                index=row["index"],
+                type=row["type"],
+                property=None,
+                railway=None,
+                company=None,
+                special=None,
+            )
+            for row in tile_rows
+        ]
+        for subtype, rows in subtype_rows.items():
+            for row in rows:
+                setattr(tiles[row["tile_id"]], subtype, SimpleNamespace(**row))
+        size = max((tile.index for tile in tiles), default=-1) + 1
+        decks = compile_decks([SimpleNamespace(**card) for card in cards], size)
+        return cls(tiles, decks)
+
+
+def owns_group(tables: BoardTables, state: GameState, seat: int, tile: int) -> bool:
+    mask = tables.group_masks[tables.group[tile]]
+    return state.owned[seat] & mask == mask
+
+
+def group_count(tables: BoardTables, state: GameState, seat: int, tile: int) -> int:
+    return (state.owned[seat] & tables.group_masks[tables.group[tile]]).bit_count()
+
+
+def rent_for(tables: BoardTables, state: GameState, tile: int, dice_total: int) -> int:
+    owner = state.owners[tile]
+    if owner == NO_OWNER or state.mortgaged[tile]:
+        return 0
+
+    kind = tables.kind[tile]
+    row = tile * RENT_SLOTS
+    if kind == PROPERTY:
+        houses = state.houses[tile]
+        rent = tables.rent[row + houses]
+        if houses == 0 and owns_group(tables, state, owner, tile):
+            rent *= 2
+        return rent
+    count = group_count(tables, state, owner, tile)
+    if kind == RAILWAY:
+        return tables.rent[row + count - 1]
+    if kind == UTILITY:
+        return tables.rent[row + count - 1] * dice_total
+    return 0
+
+
+def nearest(tables: BoardTables, position: int, kind: int) -> int:
+    """The first tile of a kind after position, position itself if there is none."""
+    for steps in range(1, tables.size):
+        tile = (position + steps) % tables.size
+        if tables.kind[tile] == kind:
+            return tile
+    return position
+
+
+def shuffle_decks(tables: BoardTables, state: GameState, seed: int):
+    """Deals the card order of a game, the same seed deals the same order."""
+    rng = random.Random(seed)
+    order = array("B")
+    for deck in tables.decks:
+        indexes = list(range(len(deck)))
+        rng.shuffle(indexes)
+        order.extend(indexes)
+    state.card_order = order
+    state.card_next = array("B", bytes(len(DECKS)))
+
+
+def _check_turn(state: GameState, seat: int):
+    if state.status is not GameStatus.started:
+        raise GameRuleError("Game not started yet")
+    if seat != state.turn:
+        raise GameRuleError("Not your turn")
+
+
+def _change_balance(state: GameState, seat: int, amount: int, events: list):
+    state.balances[seat] += amount
+    events.append(("balance", seat, state.balances[seat]))
+
+
+def _pay(state: GameState, payer: int, payee: int, amount: int, events: list):
+    _change_balance(state, payer, -amount, events)
+    if payee != NO_OWNER:
+        _change_balance(state, payee, amount, events)
+    if state.balances[payer] < 0:
+        _bankrupt(state, payer, events)
+
+
+def _bankrupt(state: GameState, seat: int, events: list):
+    """Removes a player who cannot pay, their tiles go back to the bank."""
+    state.bankrupt[seat] = 1
+    owned = state.owned[seat]
+    state.owned[seat] = 0
+    tile = 0
+    while owned:
+        if owned & 1:
+            state.owners[tile] = NO_OWNER
+            state.houses[tile] = 0
+            state.mortgaged[tile] = 0
+        owned >>= 1
+        tile += 1
+    events.append(("bankrupt", seat))
+
+    remaining = [s for s in range(len(state.players)) if not state.bankrupt[s]]
+    if len(remaining) == 1:
+        state.status = GameStatus.finished
+        events.append(("winner", remaining[0]))
+
+
+def _send_to_jail(tables: BoardTables, state: GameState, seat: int, events: list):
+    events.append(("move", seat, state.positions[seat], tables.jail))
+    state.positions[seat] = tables.jail
+    state.jail_turns[seat] = 1
+    state.doubles = 0
+    events.append(("jail", seat, True))
+
+
+def _advance(
+    tables: BoardTables, state: GameState, seat: int, steps: int, events: list
+):
+    """Moves forward, paying the Go salary when passing or landing on it."""
+    start = state.positions[seat]
+    target = (start + steps) % tables.size
+    state.positions[seat] = target
+    events.append(("move", seat, start, target))
+    if target < start:
+        _change_balance(state, seat, GO_SALARY, events)
+
+
+def _move_to(
+    tables: BoardTables, state: GameState, seat: int, target: int, events: list
+):
+    _advance(tables, state, seat, (target - state.positions[seat]) % tables.size, events)
+
+
+def _draw(
+    tables: BoardTables,
+    state: GameState,
+    seat: int,
+    deck: int,
+    dice_total: int,
+    events: list,
+):
+    """Takes the top card of a deck, applies it and puts it at the bottom."""
+    cards = tables.decks[deck]
+    if not cards:
+        events.append(("draw", seat, DECKS[deck], None))
+        return
+    top = state.card_next[deck]
+    state.card_next[deck] = (top + 1) % len(cards)
+    # Games started before decks were dealt draw in deck order.
+    if state.card_order:
+        top = state.card_order[tables.deck_offsets[deck] + top]
+    card = cards[top]
+    events.append(("draw", seat, DECKS[deck], card.description))
+
+    op, args = card.op, card.args
+    if op == ADVANCE:
+        _move_to(tables, state, seat, args[0], events)
+        resolve_tile(tables, state, seat, dice_total, events)
+    elif op == NEAREST:
+        _move_to(tables, state, seat, nearest(tables, state.positions[seat], args[0]), events)
+        resolve_tile(tables, state, seat, dice_total, events)
+    elif op == BACK:
+        start = state.positions[seat]
+        target = (start - args[0]) % tables.size
+        state.positions[seat] = target
+        events.append(("move", seat, start, target))
+        resolve_tile(tables, state, seat, dice_total, events)
+    elif op == GO_TO_JAIL:
+        _send_to_jail(tables, state, seat, events)
+    elif op == BANK:
+        if args[0] >= 0:
+            _change_balance(state, seat, args[0], events)
+        else:
+            _pay(state, seat, NO_OWNER, -args[0], events)
+    elif op == PLAYERS:
+        amount = args[0]
+        for other in range(len(state.players)):
+            if other == seat or state.bankrupt[other]:
+                continue
+            if amount >= 0:
+                _pay(state, other, seat, amount, events)
+            else:
+                _pay(state, seat, other, -amount, events)
+            if state.bankrupt[seat] or state.status is not GameStatus.started:
+                break
+    elif op == REPAIRS:
+        per_house, per_hotel = args
+        cost, owned, tile = 0, state.owned[seat], 0
+        while owned:
+            if owned & 1:
+                houses = state.houses[tile]
+                cost += per_hotel if houses == MAX_HOUSES else houses * per_house
+            owned >>= 1
+            tile += 1
+        if cost:
+            _pay(state, seat, NO_OWNER, cost, events)
+
+
+def resolve_tile(
+    tables: BoardTables, state: GameState, seat: int, dice_total: int, events: list
+):
+    """Applies the effect of the tile the player is standing on."""
+    tile = state.positions[seat]
+    kind = tables.kind[tile]
+
+    if kind <= UTILITY:
+        owner = state.owners[tile]
+        if owner == NO_OWNER:
+            state.pending = tile
+            events.append(("offer", seat, tile, tables.price[tile]))
+        elif owner != seat:
+            rent = rent_for(tables, state, tile, dice_total)
+            if rent:
+                events.append(("rent", seat, owner, tile, rent))
+                _pay(state, seat, owner, rent, events)
+    elif kind == TAX:
+        _pay(state, seat, NO_OWNER, tables.tax[tile], events)
+    elif kind == GOTO_JAIL:
+        _send_to_jail(tables, state, seat, events)
+    elif kind == CHANCE or kind == CHEST:
+        _draw(tables, state, seat, kind - CHANCE, dice_total, events)
+
+
+def roll(
+    tables: BoardTables, state: GameState, seat: int, dice1: int, dice2: int
+) -> List[Event]:
+    _check_turn(state, seat)
+    if state.rolled:
+        raise GameRuleError("You have already rolled")
+    # Rolling again after a double declines the tile offered by the last one.
+    state.pending = NO_OWNER
+
+    events: List[Event] = [("roll", seat, dice1, dice2)]
+    is_double = dice1 == dice2
+    total = dice1 + dice2
+
+    if state.jail_turns[seat]:
+        if is_double:
+            state.jail_turns[seat] = 0
+            events.append(("jail", seat, False))
+        elif state.jail_turns[seat] >= MAX_JAIL_TURNS:
+            state.jail_turns[seat] = 0
+            events.append(("jail", seat, False))
+            _pay(state, seat, NO_OWNER, JAIL_FINE, events)
+        else:
+            state.jail_turns[seat] += 1
+            state.rolled = True
+            return events
+        # Leaving jail never grants another roll.
+        is_double = False
+        state.doubles = 0
+    elif is_double:
+        state.doubles += 1
+        if state.doubles >= MAX_DOUBLES:
+            _send_to_jail(tables, state, seat, events)
+            state.rolled = True
+            return events
+
+    if not state.bankrupt[seat]:
+        _advance(tables, state, seat, total, events)
+        resolve_tile(tables, state, seat, total, events)
+
+    # A double lets the player roll again, unless they just got jailed.
+    state.rolled = not is_double or bool(state.jail_turns[seat])
+    if not state.rolled:
+        events.append(("again", seat))
+    return events
+
+
+def buy(tables: BoardTables, state: GameState, seat: int) -> List[Event]:
+    _check_turn(state, seat)
+    tile = state.pending
+    if tile == NO_OWNER:
+        raise GameRuleError("Nothing to buy")
+    price = tables.price[tile]
+    if state.balances[seat] < price:
+        raise GameRuleError("Not enough money")
+
+    events: List[Event] = []
+    state.pending = NO_OWNER
+    state.owners[tile] = seat
+    state.owned[seat] |= 1 << tile
+    events.append(("owner", tile, seat))
+    _change_balance(state, seat, -price, events)
+    return events
+
+
+def build(tables: BoardTables, state: GameState, seat: int, tile: int) -> List[Event]:
+    _check_turn(state, seat)
+    if not 0 <= tile < tables.size or tables.kind[tile] != PROPERTY:
+        raise GameRuleError("Houses can only be built on properties")
+    if state.owners[tile] != seat or not owns_group(tables, state, seat, tile):
+        raise GameRuleError("You need the whole group to build")
+    if state.group_mortgaged(tables.group_masks[tables.group[tile]]):
+        raise GameRuleError("Cannot build while the group has mortgages")
+    if state.houses[tile] >= MAX_HOUSES:
+        raise GameRuleError("Hotel already built")
+    cost = tables.house_price[tile]
+    if state.balances[seat] < cost:
+        raise GameRuleError("Not enough money")
+
+    events: List[Event] = []
+    state.houses[tile] += 1
+    events.append(("houses", tile, state.houses[tile]))
+    _change_balance(state, seat, -cost, events)
+    return events
+
+
+def mortgage(
+    tables: BoardTables, state: GameState, seat: int, tile: int
+) -> List[Event]:
+    _check_turn(state, seat)
+    if not 0 <= tile < tables.size or state.owners[tile] != seat:
+        raise GameRuleError("You do not own this tile")
+    if state.mortgaged[tile]:
+        raise GameRuleError("Tile is already mortgaged")
+    if tables.group[tile] >= 0 and state.group_houses(
+        tables.group_masks[tables.group[tile]]
+    ):
+        raise GameRuleError("Sell the houses of the group first")
+
+    events: List[Event] = []
+    state.mortgaged[tile] = 1
+    events.append(("mortgage", tile, True))
+    _change_balance(state, seat, tables.mortgage[tile], events)
+    return events
+
+
+def end_turn(tables: BoardTables, state: GameState, seat: int) -> List[Event]:
+    _check_turn(state, seat)
+    if not state.rolled and not state.bankrupt[seat]:
+        raise GameRuleError("Roll the dice first")
+
+    events: List[Event] = []
+    # Declining an offered tile leaves it with the bank.
+    state.pending = NO_OWNER
+    state.rolled = False
+    state.doubles = 0
+
+    players = len(state.players)
+    next_seat = seat
+    for _ in range(players):
+        next_seat = (next_seat + 1) % players
+        if not state.bankrupt[next_seat]:
+            break
+    state.turn = next_seat
+    events.append(("turn", next_seat))
+    return events
+
+
+ACTIONS = {
+    "roll": roll,
+    "buy": buy,
+    "build": build,
+    "mortgage": mortgage,
+    "end": end_turn,
+}
+
+
+def apply(tables: BoardTables, state: GameState, action: Sequence) -> List[Event]:
+    """
+    Applies an action in its logged form, e.g. ["roll", seat, 3, 4] or
+    ["join", user_id, username], and counts it in state.seq. ["start", seed]
+    deals the cards with the seed, so replaying the log deals them again.
+    """
+    match action:
+        case ["join", user_id, username]:
+            state.add_user(user_id, username)
+            events: List[Event] = [("join", user_id, username)]
+        case ["leave", user_id]:
+            state.remove_user(user_id)
+            events = [("leave", user_id)]
+        case ["start", *seed]:
+            if state.status is not GameStatus.waiting:
+                raise GameRuleError("The game has already started")
+            state.start()
+            if seed:
+                shuffle_decks(tables, state, seed[0])
+            events = [("start", list(state.players), STARTING_BALANCE)]
+        case [name, seat, *args] if name in ACTIONS:
+            events = ACTIONS[name](tables, state, seat, *args)
+        case _:
+            raise GameRuleError(f"Unknown action {action!r}")
+    state.seq += 1
+    return events
+
+
+__all__ = [
+    "BoardTables",
+    "GameRuleError",
+    "Event",
+    "MAX_PLAYERS",
+    "roll",
+    "buy",
+    "build",
+    "mortgage",
+    "end_turn",
+    "apply",
+    "ACTIONS",
+    "rent_for",
+    "resolve_tile",
+    "nearest",
+    "shuffle_decks",
+]
@@ -0,0 +1,208 @@
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Sequence, Set
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.database import db_helper
+from app.database.models import GameEvent, GameSnapshot
+from app.settings import settings
+from . import engine
+from .board import BoardSnapshot
+from .game_state import BoardMismatchError, GameState
+
+
+class GameLog:
+    """
+    Append-only log of the actions applied to every room.
+    Actions are kept in memory and written in one transaction per flush, either
+    every flush_interval seconds or once batch_size actions are pending. Every
+    snapshot_every actions the room state is stored too, so rebuilding a room
+    replays at most that many actions on top of its last snapshot.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float,
+        batch_size: int,
+        snapshot_every: int,
+        max_pending: int,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.max_pending = max_pending
+        # Whether the last flush failed, and actions given up since the start.
+        self.failing = False
+        self.dropped = 0
+        self._events: List[dict] = []
+        self._snapshots: Dict[uuid.UUID, dict] = {}
+        # What the running flush is writing, still visible to restore.
+        self._writing_events: List[dict] = []
+        self._writing_snapshots: Dict[uuid.UUID, dict] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def append(self, game: uuid.UUID, state: GameState, action: Sequence):
+        """Records an action that has just been applied to state."""
+        self._events.append({"game": game, "seq": state.seq, "action": list(action)})
+        if state.seq % self.snapshot_every == 0:
+            self.snapshot(game, state)
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def snapshot(self, game: uuid.UUID, state: GameState):
+        self._snapshots[game] = {"game": game, "seq": state.seq, "data": state.dumps()}
+
+    async def _writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Writing the game log failed: {e!r}")
+
+    async def flush(self):
+        """Writes everything pending as one group commit."""
+        async with self._lock:
+            events, self._events = self._events, []
+            snapshots, self._snapshots = self._snapshots, {}
+            if not events and not snapshots:
+                self.failing = False
+                return
+            self._writing_events, self._writing_snapshots = events, snapshots
+            try:
+                async with db_helper.session_factory() as session:
+                    if events:
+                        # An action already logged, e.g. by a worker that lost the
+                        # room meanwhile, must not fail the batch of every room.
+                        query = pg_insert(GameEvent).on_conflict_do_nothing(
+                            index_elements=[GameEvent.game, GameEvent.seq]
+                        )
+                        await session.execute(query, events)
+                    if snapshots:
+                        query = pg_insert(GameSnapshot).values(list(snapshots.values()))
+                        query = query.on_conflict_do_update(
+                            index_elements=[GameSnapshot.game],
+                            set_={"seq": query.excluded.seq, "data": query.excluded.data},
+                        )
+                        await session.execute(query)
+                    await session.commit()
+            except Exception:
+                # Keep everything for the next flush, newer snapshots win.
+                self.failing = True
+                self._events[:0] = events
+                self._snapshots = snapshots | self._snapshots
+                overflow = len(self._events) - self.max_pending
+                if overflow > 0:
+                    # Rooms still restore from their last snapshot written.
+                    del self._events[:overflow]
+                    self.dropped += overflow
+                    logger.error(
+                        f"Game log is over {self.max_pending} pending actions, "
+                        f"dropped the {overflow} oldest"
+                    )
+                raise
+            else:
+                self.failing = False
+            finally:
+                self._writing_events, self._writing_snapshots = [], {}
+
+    async def games(self) -> Set[uuid.UUID]:
+        """Ids of every room in the log, including actions not written yet."""
+        async with db_helper.session_factory() as session:
+            result = await session.scalars(
+                select(GameSnapshot.game).union(select(GameEvent.game))
+            )
+            games = set(result)
+        games.update(event["game"] for event in (*self._writing_events, *self._events))
+        return games
+
+    async def restore(
+        self, game: uuid.UUID, board: BoardSnapshot
+    ) -> Optional[GameState]:
+        """
+        Rebuilds a room from its last snapshot and the actions logged after it.
+        Snapshots and actions not written yet are used too, so restoring works
+        while the database writes are failing, as far as it can be read. A
+        snapshot of another board is migrated by replaying the whole log, the
+        room is given up if that is not possible.
+        """
+        pending = {
+            event["seq"]: event["action"]
+            for event in (*self._writing_events, *self._events)
+            if event["game"] == game
+        }
+        pending_snapshot = self._snapshots.get(game) or self._writing_snapshots.get(game)
+
+        async with db_helper.session_factory() as session:
+            snapshot = await GameSnapshot.find_one(session, game=game)
+            if snapshot is not None:
+                snapshot = {"seq": snapshot.seq, "data": snapshot.data}
+            if pending_snapshot is not None and (
+                snapshot is None or pending_snapshot["seq"] > snapshot["seq"]
+            ):
+                snapshot = pending_snapshot
+
+            state = None
+            if snapshot is not None:
+                try:
+                    state = GameState.loads(snapshot["data"], board)
+                except BoardMismatchError as e:
+                    # Replay the whole log on the current board instead.
+                    logger.warning(f"Snapshot of game {game} is not usable: {e}")
+            after = state.seq if state is not None else 0
+            rows = await session.execute(
+                select(GameEvent.seq, GameEvent.action)
+                .where(GameEvent.game == game, GameEvent.seq > after)
+                .order_by(GameEvent.seq)
+            )
+            logged = dict(rows.tuples().all())
+
+        actions = sorted(
+            (seq, action) for seq, action in (logged | pending).items() if seq > after
+        )
+        if state is None:
+            if not actions:
+                return None
+            if snapshot is not None and [seq for seq, _ in actions] != list(
+                range(1, len(actions) + 1)
+            ):
+                logger.error(f"Game {game} cannot be rebuilt, its log has gaps")
+                return None
+            state = GameState(board)
+        try:
+            for _, action in actions:
+                engine.apply(board.tables, state, action)
+        except engine.GameRuleError as e:
+            logger.error(f"Game {game} cannot be rebuilt on this board: {e}")
+            return None
+        logger.info(
+            f"Restored game {game} at seq {state.seq}, replayed {len(actions)} actions"
+        )
+        return state
+
+
+game_log = GameLog(
+    settings.GAME_LOG_FLUSH_INTERVAL,
+    settings.GAME_LOG_BATCH_SIZE,
+    settings.GAME_LOG_SNAPSHOT_EVERY,
+    settings.GAME_LOG_MAX_PENDING,
+)
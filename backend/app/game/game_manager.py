@@ -1,42 +1,342 @@
+import asyncio
+import sys
+import time
 import uuid
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Optional
 from fastapi import WebSocket, WebSocketException
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from loguru import logger
 import random
+from .backend import create_room_backend, worker_host, WORKER_HOST, WORKER_ID
+from .board import board_cache, BoardSnapshot
+from .codec import Encoded, Encoding, envelope
 from .connection_manager import ConnectionManager
-from ..database.models import Tile, Property, User
+from .outbox import FrameKind
+from . import engine
+from .engine import GameRuleError
+from .game_log import game_log
+from .game_state import BoardMismatchError, GameState, GameStatus
+from .room import Handler, Room
+from .shards import shard_pool
+from ..database import db_helper
+from ..database.models import User
+from ..settings import settings
+from ..user.tokens import create_resume_token
+
+# Close code telling the client to reconnect through the node named in the reason.
+ROOM_MOVED_CODE = 4307
+# Close code telling the client to connect again, another worker process of the
+# same node owns the room and the proxy cannot choose the process.
+ROOM_BUSY_CODE = 4308
 
 
 class GameManager(ConnectionManager):
     def __init__(self):
-        super().__init__()
-        self.active_games: Dict[uuid.UUID, Dict[str, Any]] = {}
-
-    async def first_init_game(self, game: uuid.UUID, session: AsyncSession):
-        self.active_games[game] = {
-            "tiles": [],
-            "users": {},
-            "game_data": {},
-            "status": "waiting",
+        super().__init__(create_room_backend())
+        self.active_games: Dict[uuid.UUID, GameState] = {}
+        # Latest delta frames per room, replayed to clients resuming a session.
+        self.recent_deltas: Dict[uuid.UUID, deque[dict]] = {}
+        # Actors of the rooms with sockets on this worker.
+        self.rooms: Dict[uuid.UUID, Room] = {}
+        # Monotonic time each room was last used at, least recently used first,
+        # and the estimated size of rooms not used since it was measured.
+        self.last_used: OrderedDict[uuid.UUID, float] = OrderedDict()
+        self.room_bytes: Dict[uuid.UUID, int] = {}
+        self.evicted = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await shard_pool.start()
+        await game_log.start()
+        await super().start(on_board=self._board_reloaded)
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        rooms = [room.task for room in self.rooms.values() if room.task is not None]
+        for task in rooms:
+            task.cancel()
+        await asyncio.gather(*rooms, return_exceptions=True)
+        # Snapshot every room we own, so restoring them replays nothing.
+        for game, state in self.active_games.items():
+            if self.backend.owns(game):
+                game_log.snapshot(game, state)
+        await game_log.stop()
+        await shard_pool.stop()
+        await super().stop()
+
+    async def _board_reloaded(self, digest: str):
+        """Loads the board another worker reloaded, unless we have it already."""
+        if board_cache.snapshot.digest == digest:
+            return
+        try:
+            await board_cache.refresh()
+        except Exception as e:
+            logger.error(f"Reloading the board of another worker failed: {e!r}")
+
+    def room(self, game: uuid.UUID) -> Room:
+        """Returns the actor of the room, starting it if it is not running."""
+        room = self.rooms.get(game)
+        # A finished actor stays in rooms until its done callback runs, queuing
+        # to it meanwhile would never be answered.
+        if room is None or room.task.done():
+            room = self.rooms[game] = Room(game)
+            room.task = asyncio.create_task(
+                room.run(self.hold, self.flush, self.is_idle)
+            )
+            room.task.add_done_callback(lambda _: self._room_done(room))
+        return room
+
+    def _room_done(self, room: Room):
+        if self.rooms.get(room.game) is room:
+            del self.rooms[room.game]
+
+    def is_idle(self, game: uuid.UUID) -> bool:
+        return game not in self.active_connections
+
+    async def call(self, game: uuid.UUID, handler: Handler, *args):
+        """Runs handler(game, *args) in the room's actor and returns its result."""
+        self.touch(game)
+        return await self.room(game).call(handler, *args)
+
+    async def post(self, game: uuid.UUID, handler: Handler, *args):
+        """Queues handler(game, *args) in the room's actor."""
+        self.touch(game)
+        await self.room(game).post(handler, *args)
+
+    def touch(self, game: uuid.UUID):
+        self.last_used[game] = time.monotonic()
+        self.last_used.move_to_end(game)
+        self.room_bytes.pop(game, None)
+
+    def room_size(self, game: uuid.UUID) -> int:
+        """Estimated bytes held by a room and its kept deltas."""
+        size = self.room_bytes.get(game)
+        if size is None:
+            state = self.active_games.get(game)
+            size = state.nbytes() if state is not None else 0
+            for delta in self.recent_deltas.get(game, ()):
+                size += sys.getsizeof(delta) + sys.getsizeof(delta["content"])
+                size += sum(sys.getsizeof(event) for event in delta["content"])
+            self.room_bytes[game] = size
+        return size
+
+    def is_evictable(self, game: uuid.UUID) -> bool:
+        """Rooms nobody is connected to and with no command running or queued."""
+        room = self.rooms.get(game)
+        return game not in self.active_connections and (room is None or room.task.done())
+
+    def forget(self, game: uuid.UUID):
+        self.active_games.pop(game, None)
+        self.recent_deltas.pop(game, None)
+        self.last_used.pop(game, None)
+        self.room_bytes.pop(game, None)
+        shard_pool.forget(game)
+
+    async def evict(self, games: list[uuid.UUID]) -> int:
+        """
+        Drops idle rooms from memory. The rooms are snapshotted to the game log
+        first and only dropped once that is written, so the next player
+        connecting gets them back through get_game. Rooms used while writing
+        are kept. Returns the number of rooms evicted.
+        """
+        seen = {}
+        for game in games:
+            state = self.active_games.get(game)
+            if state is not None and state.seq and self.backend.owns(game):
+                game_log.snapshot(game, state)
+            seen[game] = (state.seq if state is not None else 0, self.last_used.get(game))
+        try:
+            await game_log.flush()
+        except Exception as e:
+            logger.error(
+                f"Not evicting {len(games)} idle rooms, writing the game log failed: {e!r}"
+            )
+            return 0
+
+        evicted = 0
+        for game in games:
+            state = self.active_games.get(game)
+            seq = state.seq if state is not None else 0
+            if self.is_evictable(game) and seen[game] == (seq, self.last_used.get(game)):
+                self.forget(game)
+                evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    async def sweep(self) -> int:
+        """
+        Evicts rooms idle for longer than ROOM_IDLE_TTL, then the least recently
+        used idle rooms while the rooms take more than ROOM_MEMORY_BUDGET bytes.
+        Returns the number of rooms evicted.
+        """
+        await self.backend.expire_reservations()
+        games = []
+        idle_before = time.monotonic() - settings.ROOM_IDLE_TTL
+        for game, used in self.last_used.items():
+            if used > idle_before:
+                break
+            if self.is_evictable(game):
+                games.append(game)
+
+        budget = settings.ROOM_MEMORY_BUDGET
+        if budget:
+            chosen = set(games)
+            total = sum(self.room_size(game) for game in self.last_used if game not in chosen)
+            for game in self.last_used:
+                if total <= budget:
+                    break
+                if game not in chosen and self.is_evictable(game):
+                    total -= self.room_size(game)
+                    games.append(game)
+            if total > budget:
+                logger.warning(
+                    f"Rooms in use take {total} bytes, over the budget of {budget}"
+                )
+        if not games:
+            return 0
+        return await self.evict(games)
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(settings.ROOM_SWEEP_INTERVAL)
+            try:
+                evicted = await self.sweep()
+            except Exception as e:
+                logger.error(f"Evicting idle rooms failed: {e!r}")
+                continue
+            if evicted:
+                logger.info(f"Evicted {evicted} idle rooms, {len(self.active_games)} left")
+
+    def metrics(self) -> dict:
+        rooms = [room.stats() for room in self.rooms.values()]
+        return {
+            "rooms": len(self.active_games),
+            "rooms_bytes": sum(self.room_size(game) for game in self.active_games),
+            "rooms_evicted": self.evicted,
+            "connections": len(self.connections),
+            "actors": len(self.rooms),
+            "commands_queued": sum(room["queued"] for room in rooms),
+            "commands_processed": sum(room["processed"] for room in rooms),
+            "slowest_command": max((room["slowest"] for room in rooms), default=0.0),
+            "shards": shard_pool.stats(),
         }
-        query = select(Tile).options(
-            joinedload(Tile.property).joinedload(Property.group),
-            joinedload(Tile.railway),
-            joinedload(Tile.company),
-            joinedload(Tile.special),
-        )
-        result = await session.execute(query)
-        tiles = result.scalars().all()
-        self.active_games[game]["tiles"] = jsonable_encoder(tiles)
-        # TODO: Add cart data
 
-    async def get_username(self, game: uuid.UUID, user_id: int, session: AsyncSession):
-        username = await User.find_username_by_id(session, user_id)
-        self.active_games[game]["users"][user_id] = username
+    def first_init_game(self, game: uuid.UUID):
+        # The board is shared between rooms, a reload only affects new games.
+        self.active_games[game] = GameState(board_cache.snapshot)
+        self.recent_deltas.pop(game, None)
+
+    async def claim_room(self, game: uuid.UUID) -> Optional[str]:
+        """
+        Makes sure this worker holds the room lease before the room is read or
+        changed. Returns None if it does, otherwise the WORKER_ID of the owner.
+        A worker without the lease never keeps or changes a copy of the room.
+        """
+        if self.backend.owns(game):
+            return None
+        owner = await self.backend.acquire_room(game)
+        # Whatever we had may be stale, the owner's state is the shared one.
+        self.forget(game)
+        if owner != WORKER_ID:
+            return owner
+        self.touch(game)
+        return None
+
+    async def close_moved(self, websocket: WebSocket, owner: str):
+        """Sends the client to the worker holding the room lease."""
+        if worker_host(owner) != WORKER_HOST:
+            await websocket.close(code=ROOM_MOVED_CODE, reason=worker_host(owner))
+        else:
+            await websocket.close(code=ROOM_BUSY_CODE)
+
+    async def move_room(self, game: uuid.UUID, owner: str):
+        """Closes every local socket of a room whose lease went to another worker."""
+        for websocket in list(self.active_connections.get(game, ())):
+            self._disconnect(game, websocket)
+            try:
+                await asyncio.wait_for(
+                    self.close_moved(websocket, owner), timeout=settings.WS_SEND_TIMEOUT
+                )
+            except Exception:
+                pass
+
+    async def get_game(self, game: uuid.UUID) -> Optional[GameState]:
+        """
+        Returns the room, loading it from the shared state or rebuilding it from
+        the game log if it is not in memory. Only called holding the room lease.
+        """
+        state = self.active_games.get(game)
+        if state is None:
+            data = await self.backend.load_state(game)
+            if data is not None:
+                try:
+                    state = GameState.loads(data, board_cache.snapshot)
+                except BoardMismatchError as e:
+                    logger.warning(f"Shared state of game {game} is stale: {e}")
+            if state is None and await self.backend.is_logged(game):
+                # Lost with a restarted worker, rebuild it from the game log.
+                # Rooms nobody used yet are not looked up in the database.
+                state = await game_log.restore(game, board_cache.snapshot)
+            if state is not None:
+                self.active_games[game] = state
+        return state
+
+    async def save_game(self, game: uuid.UUID):
+        if self.backend.shares_state and game in self.active_games:
+            await self.backend.save_state(game, self.active_games[game].dumps())
+
+    async def apply(self, game: uuid.UUID, action: list) -> list[engine.Event]:
+        """
+        Applies an action to the room, appends it to the game log and sends its
+        events to the room as a delta numbered with the new state.seq.
+        """
+        state = self.active_games[game]
+        if shard_pool.enabled:
+            events, data = await shard_pool.apply(game, state, action)
+            state = self.active_games[game] = GameState.loads(data, state.board)
+        else:
+            events = engine.apply(state.board.tables, state, action)
+        game_log.append(game, state, action)
+        if state.seq == 1:
+            await self.backend.mark_logged(game)
+        if action[0] in ("join", "leave", "start"):
+            await self.backend.update_public_room(
+                game, state.users, state.status is GameStatus.waiting
+            )
+        delta = self.create_delta_data(state, events)
+        if game not in self.recent_deltas:
+            self.recent_deltas[game] = deque(maxlen=settings.WS_RESUME_BUFFER)
+        self.recent_deltas[game].append(delta)
+        await self.broadcast(game, delta)
+        return events
+
+    def missed_deltas(self, game: uuid.UUID, since: int) -> Optional[list[dict]]:
+        """Deltas numbered after since, None if some of them are no longer kept."""
+        state = self.active_games[game]
+        if since > state.seq:
+            return None
+        deltas = [
+            delta
+            for delta in self.recent_deltas.get(game, ())
+            if delta["seq"] > since
+        ]
+        if len(deltas) != state.seq - since:
+            return None
+        return deltas
+
+    async def get_username(
+        self, game: uuid.UUID, user_id: int, username: Optional[str] = None
+    ):
+        if username is None:
+            # Sockets live for hours, so only hold a connection for this one query.
+            async with db_helper.session_factory() as session:
+                username = await User.find_username_by_id(session, user_id)
+        await self.apply(game, ["join", user_id, username])
 
     def create_data(self, data):
         return {
@@ -45,82 +345,232 @@ class GameManager(ConnectionManager):
             "timestamp": round(datetime.now(timezone.utc).timestamp()),
         }
 
-    async def connect(
-        self, game: uuid.UUID, websocket: WebSocket, user_id: int, session: AsyncSession
+    def create_state_data(self, state: GameState) -> dict:
+        """Full room state, clients apply the deltas numbered after its seq."""
+        return {
+            "content": state.as_dict(),
+            "type": "state",
+            "seq": state.seq,
+            "timestamp": round(datetime.now(timezone.utc).timestamp()),
+        }
+
+    def create_delta_data(self, state: GameState, events: list[engine.Event]) -> dict:
+        return {
+            "content": events,
+            "type": "delta",
+            "seq": state.seq,
+            "timestamp": round(datetime.now(timezone.utc).timestamp()),
+        }
+
+    async def send_state(self, game: uuid.UUID, websocket: WebSocket):
+        await self.send_personal_message(
+            self.create_state_data(self.active_games[game]),
+            websocket,
+            kind=FrameKind.state,
+        )
+
+    def create_board_data(self, board: BoardSnapshot, encoding: Encoding) -> Encoded:
+        """Same envelope as create_data, built around the pre-serialized board."""
+        timestamp = round(datetime.now(timezone.utc).timestamp())
+        content = board.packed if encoding is Encoding.msgpack else board.text
+        return envelope(content, "game", timestamp, encoding)
+
+    async def send_resume_token(
+        self, game: uuid.UUID, websocket: WebSocket, user_id: int, session: Optional[str]
     ):
-        # TODO: fix if user is already in game but reconnects
-        if game in self.active_games and (
-            self.active_games[game]["status"] == "started"
-            or len(self.active_games[game]["users"]) == 4
+        token = create_resume_token(
+            {
+                "game": str(game),
+                "user": user_id,
+                "name": self.active_games[game].users[user_id],
+                "session": session,
+            }
+        )
+        await self.send_personal_message(
+            {
+                "content": token,
+                "type": "resume",
+                "timestamp": round(datetime.now(timezone.utc).timestamp()),
+            },
+            websocket,
+        )
+
+    async def connect(
+        self,
+        game: uuid.UUID,
+        websocket: WebSocket,
+        user_id: int,
+        username: Optional[str] = None,
+        since: Optional[int] = None,
+        session: Optional[str] = None,
+    ) -> bool:
+        """
+        Joins the room, returns False if the client was sent to another node.
+        A client resuming a session passes the username from its resume token and
+        the last seq it applied, and is sent only the deltas it missed if possible.
+        The resume token sent back is bound to the login session given.
+        """
+        owner = await self.claim_room(game)
+        if owner is not None:
+            await websocket.accept()
+            await self.close_moved(websocket, owner)
+            return False
+
+        state = await self.get_game(game)
+        is_member = state is not None and user_id in state.users
+        # Seats reserved through the lobby count as taken for everybody else.
+        if not is_member and (
+            (state is not None and state.is_started)
+            or not await self.backend.has_seat(
+                game, user_id, len(state.users) if state is not None else 0
+            )
         ):
+            if game not in self.active_connections:
+                await self.backend.release_room(game)
             raise WebSocketException(code=403)
 
         await super()._connect(game, websocket)
-        if game not in self.active_games:
-            await self.first_init_game(game, session)
+        if state is None:
+            self.first_init_game(game)
 
-        await self.send_personal_message(
-            self.create_data(self.active_games[game]["tiles"]), websocket
-        )
+        missed = self.missed_deltas(game, since) if since is not None else None
+        if missed is not None:
+            for delta in missed:
+                await self.send_personal_message(delta, websocket)
+        else:
+            await self.send_personal_frame(
+                self.create_board_data(
+                    self.active_games[game].board, self.encoding(websocket)
+                ),
+                websocket,
+            )
+            await self.send_state(game, websocket)
 
-        if user_id not in self.active_games[game]["users"]:  # If user firstly connect
-            await self.get_username(game, user_id, session)
+        if user_id not in self.active_games[game].users:  # If user firstly connect
+            await self.get_username(game, user_id, username)
             await self.broadcast_except_sender(
                 game,
-                self.create_data(f"{self.active_games[game]['users'][user_id]} joined"),
+                self.create_data(f"{self.active_games[game].users[user_id]} joined"),
                 websocket,
             )
+            await self.save_game(game)
+        await self.send_resume_token(game, websocket, user_id, session)
+        return True
 
     async def disconnect(self, game: uuid.UUID, websocket: WebSocket, user_id: int):
+        if not self.backend.owns(game):
+            # The room moved to another worker, it is not ours to change.
+            super()._disconnect(game, websocket)
+            return
+        await self.get_game(game)
         await self.broadcast_except_sender(
             game,
-            self.create_data(
-                f"{self.active_games[game]['users'][user_id]} disconnected"
-            ),
+            self.create_data(f"{self.active_games[game].users[user_id]} disconnected"),
             websocket,
         )
-        if self.active_games[game]["status"] != "started":
-            del self.active_games[game]["users"][user_id]
+        if not self.active_games[game].is_started:
+            await self.apply(game, ["leave", user_id])
+            await self.save_game(game)
         super()._disconnect(game, websocket)
+        if game not in self.active_connections:
+            # Nobody is left here, let the next player's worker take the room.
+            await self.backend.release_room(game)
 
     async def start_game(self, game: uuid.UUID, websocket: WebSocket):
-        if len(self.active_games[game]["users"]) < 2:
+        if len(self.active_games[game].users) < 2:
             await self.send_personal_message(
                 self.create_data("Need at least 2 players to start the game"), websocket
             )
             return
-        self.active_games[game]["status"] = "started"
-        # TODO: Add logic for starting the game (player order, etc.)
+        # The seed is logged with the action, so a replay deals the same cards.
+        try:
+            await self.apply(game, ["start", random.getrandbits(32)])
+        except GameRuleError as e:
+            await self.send_personal_message(self.create_data(str(e)), websocket)
+            return
         await self.broadcast(game, self.create_data("Game started"))
 
-    async def roll_dice(self, game: uuid.UUID, websocket: WebSocket, user_id: int):
-        # TODO: Add logic for checking if it's user's turn
-        if self.active_games[game]["status"] != "started":
+    def describe(self, state: GameState, event: engine.Event) -> str:
+        names = [state.users.get(user_id, "?") for user_id in state.players]
+        match event:
+            case ("roll", seat, dice1, dice2):
+                return f"{names[seat]} rolled {dice1} {dice2}"
+            case ("again", seat):
+                return f"{names[seat]} rolls again"
+            case ("move", seat, _, target):
+                return f"{names[seat]} moved to {target}"
+            case ("balance", seat, balance):
+                return f"{names[seat]} has {balance}"
+            case ("rent", seat, owner, tile, rent):
+                return f"{names[seat]} paid {rent} rent to {names[owner]} for {tile}"
+            case ("offer", seat, tile, price):
+                return f"{names[seat]} can buy {tile} for {price}"
+            case ("owner", tile, seat):
+                return f"{names[seat]} bought {tile}"
+            case ("houses", tile, houses):
+                return f"{tile} now has {houses} houses"
+            case ("mortgage", tile, _):
+                return f"{tile} mortgaged"
+            case ("jail", seat, True):
+                return f"{names[seat]} went to jail"
+            case ("jail", seat, False):
+                return f"{names[seat]} left jail"
+            case ("draw", seat, deck, None):
+                return f"{names[seat]} draws a {deck} card"
+            case ("draw", seat, deck, description):
+                return f"{names[seat]} draws a {deck} card: {description}"
+            case ("turn", seat):
+                return f"{names[seat]}'s turn"
+            case ("bankrupt", seat):
+                return f"{names[seat]} went bankrupt"
+            case ("winner", seat):
+                return f"{names[seat]} won the game"
+        return str(event)
+
+    async def play(
+        self, game: uuid.UUID, websocket: WebSocket, user_id: int, action: str, *args
+    ):
+        """Applies a player action for the user and broadcasts what happened."""
+        state = self.active_games[game]
+        if user_id not in state.players:
             await self.send_personal_message(
-                self.create_data("Game not started yet"), websocket
+                self.create_data("You are not playing in this game"), websocket
             )
             return
-        dice1 = random.randint(1, 6)
-        dice2 = random.randint(1, 6)
-        # TODO: Add logic for checking if user is in jail
-        # TODO: Add separating for sending dice roll message
+        try:
+            events = await self.apply(game, [action, state.seat(user_id), *args])
+        except GameRuleError as e:
+            await self.send_personal_message(self.create_data(str(e)), websocket)
+            return
+        # Running the rules in a shard replaces the room with its new state.
+        state = self.active_games[game]
         await self.broadcast(
             game,
-            self.create_data(
-                f"{self.active_games[game]['users'][user_id]} rolled {dice1} {dice2}"
-            ),
+            self.create_data(". ".join(self.describe(state, event) for event in events)),
         )
-        # TODO: Add logic for moving the user position
+
+    async def roll_dice(self, game: uuid.UUID, websocket: WebSocket, user_id: int):
+        dice1 = random.randint(1, 6)
+        dice2 = random.randint(1, 6)
+        await self.play(game, websocket, user_id, "roll", dice1, dice2)
 
     async def process_game_message(
         self, game: uuid.UUID, websocket: WebSocket, data: dict, user_id: int
     ):
         content = data["content"]
-        match content:
-            case "start":
+        match content.split():
+            case ["start"]:
                 await self.start_game(game, websocket)
-            case "roll":
+            case ["roll"]:
                 await self.roll_dice(game, websocket, user_id)
+            case ["buy"]:
+                await self.play(game, websocket, user_id, "buy")
+            case ["end"]:
+                await self.play(game, websocket, user_id, "end")
+            case ["build", tile] if tile.isdigit():
+                await self.play(game, websocket, user_id, "build", int(tile))
+            case ["mortgage", tile] if tile.isdigit():
+                await self.play(game, websocket, user_id, "mortgage", int(tile))
 
     async def process_chat_message(
         self, game: uuid.UUID, websocket: WebSocket, data: dict, user_id: int
@@ -130,7 +580,16 @@ class GameManager(ConnectionManager):
     async def process_message(
         self, game: uuid.UUID, websocket: WebSocket, data: dict, user_id: int
     ):
+        owner = await self.claim_room(game)
+        if owner is not None:
+            await self.move_room(game, owner)
+            return
+        await self.get_game(game)
         if data["type"] == "game":
             await self.process_game_message(game, websocket, data, user_id)
+            await self.save_game(game)
         elif data["type"] == "chat":
             await self.process_chat_message(game, websocket, data, user_id)
+        elif data["type"] == "resync":
+            # The client missed a delta, start it over from the full state.
+            await self.send_state(game, websocket)
@@ -0,0 +1,259 @@
+import enum
+import json
+import struct
+import sys
+from array import array
+from typing import TYPE_CHECKING, Dict, Tuple
+
+if TYPE_CHECKING:
+    from .board import BoardSnapshot
+
+MAX_PLAYERS = 4
+STARTING_BALANCE = 1500
+NO_OWNER = -1
+
+
+class BoardMismatchError(ValueError):
+    """A dumped room was played on a different board than the one loading it."""
+
+
+class GameStatus(enum.Enum):
+    waiting = "waiting"
+    started = "started"
+    finished = "finished"
+
+
+class GameState:
+    """
+    State of a single room.
+    The board is the shared snapshot and is never copied. Per-player values are
+    kept in fixed-size arrays indexed by seat, per-tile values in arrays indexed
+    by tile position, so a room costs a few hundred bytes on top of its users.
+    Anything with a size works as the board, simulations pass engine.BoardTables.
+    """
+
+    __slots__ = (
+        "board",
+        "status",
+        "seq",
+        "users",
+        "players",
+        "turn",
+        "rolled",
+        "doubles",
+        "pending",
+        "positions",
+        "balances",
+        "jail_turns",
+        "bankrupt",
+        "owned",
+        "owners",
+        "houses",
+        "mortgaged",
+        "card_order",
+        "card_next",
+    )
+
+    def __init__(self, board: "BoardSnapshot"):
+        self.board = board
+        self.status = GameStatus.waiting
+        # Number of actions applied so far
+        self.seq = 0
+        # user_id -> username, in joining order
+        self.users: Dict[int, str] = {}
+        # user ids by seat, fixed when the game starts
+        self.players: Tuple[int, ...] = ()
+        self.turn = 0
+        # Whether the player on turn has used their roll, doubles made in a row
+        # and the tile they may buy, if any.
+        self.rolled = False
+        self.doubles = 0
+        self.pending = NO_OWNER
+
+        self.positions = array("B", bytes(MAX_PLAYERS))
+        self.balances = array("i", [0]) * MAX_PLAYERS
+        # 0 when free, otherwise the number of the current turn in jail
+        self.jail_turns = array("B", bytes(MAX_PLAYERS))
+        self.bankrupt = bytearray(MAX_PLAYERS)
+        # Bitmask of owned tile positions per seat, mirrors owners
+        self.owned = array("Q", [0]) * MAX_PLAYERS
+        self.owners = array("b", [NO_OWNER]) * board.size
+        self.houses = array("B", bytes(board.size))
+        self.mortgaged = bytearray(board.size)
+        # Card indexes of every deck in dealt order, filled when the game starts,
+        # and the position of the top card per deck.
+        self.card_order = array("B")
+        self.card_next = array("B", bytes(2))
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.users) >= MAX_PLAYERS
+
+    @property
+    def is_started(self) -> bool:
+        return self.status is GameStatus.started
+
+    def add_user(self, user_id: int, username: str):
+        self.users[user_id] = username
+
+    def remove_user(self, user_id: int):
+        self.users.pop(user_id, None)
+
+    def seat(self, user_id: int) -> int:
+        return self.players.index(user_id)
+
+    def group_houses(self, mask: int) -> int:
+        """Number of houses on the tiles of a group bitmask."""
+        houses, tile = 0, 0
+        while mask:
+            if mask & 1:
+                houses += self.houses[tile]
+            mask >>= 1
+            tile += 1
+        return houses
+
+    def group_mortgaged(self, mask: int) -> bool:
+        tile = 0
+        while mask:
+            if mask & 1 and self.mortgaged[tile]:
+                return True
+            mask >>= 1
+            tile += 1
+        return False
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the room, the shared board not included."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.users) + sys.getsizeof(self.players)
+        size += sum(sys.getsizeof(username) for username in self.users.values())
+        for values in (
+            self.positions,
+            self.balances,
+            self.jail_turns,
+            self.bankrupt,
+            self.owned,
+            self.owners,
+            self.houses,
+            self.mortgaged,
+            self.card_order,
+            self.card_next,
+        ):
+            size += sys.getsizeof(values)
+        return size
+
+    def start(self):
+        """Assigns seats in joining order and hands out the starting money."""
+        self.players = tuple(self.users)
+        self.turn = 0
+        self.rolled = False
+        self.doubles = 0
+        self.pending = NO_OWNER
+        for seat in range(len(self.players)):
+            self.positions[seat] = 0
+            self.balances[seat] = STARTING_BALANCE
+        self.status = GameStatus.started
+
+    def as_dict(self) -> dict:
+        """JSON form sent to clients, per-seat lists only cover seated players."""
+        seats = len(self.players)
+        return {
+            "board": self.board.version,
+            "status": self.status.value,
+            "users": list(self.users.items()),
+            "players": self.players,
+            "turn": self.turn,
+            "rolled": self.rolled,
+            "pending": self.pending,
+            "positions": self.positions.tolist()[:seats],
+            "balances": self.balances.tolist()[:seats],
+            "jail": self.jail_turns.tolist()[:seats],
+            "bankrupt": list(self.bankrupt[:seats]),
+            "owners": self.owners.tolist(),
+            "houses": self.houses.tolist(),
+            "mortgaged": list(self.mortgaged),
+        }
+
+    def dumps(self) -> bytes:
+        """Binary form used to share the room with other workers."""
+        header = json.dumps(
+            {
+                "status": self.status.value,
+                "seq": self.seq,
+                "users": list(self.users.items()),
+                "players": self.players,
+                "turn": self.turn,
+                "rolled": self.rolled,
+                "doubles": self.doubles,
+                "pending": self.pending,
+                "cards": len(self.card_order),
+                # Board the room is played on, BoardTables has no digest.
+                "board": getattr(self.board, "digest", None),
+                "size": self.board.size,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return b"".join(
+            (
+                struct.pack("<I", len(header)),
+                header,
+                self.positions.tobytes(),
+                self.balances.tobytes(),
+                self.jail_turns.tobytes(),
+                self.owned.tobytes(),
+                self.owners.tobytes(),
+                self.houses.tobytes(),
+                bytes(self.bankrupt),
+                bytes(self.mortgaged),
+                self.card_order.tobytes(),
+                self.card_next.tobytes(),
+            )
+        )
+
+    @classmethod
+    def loads(cls, data: bytes, board: "BoardSnapshot") -> "GameState":
+        state = cls(board)
+        (header_size,) = struct.unpack_from("<I", data)
+        offset = 4 + header_size
+        header = json.loads(data[4:offset])
+        # Rooms dumped before the board was recorded only have their size checked.
+        size = header.get("size", board.size)
+        digest = header.get("board")
+        if size != board.size or (
+            digest is not None
+            and getattr(board, "digest", None) is not None
+            and digest != board.digest
+        ):
+            raise BoardMismatchError(
+                f"Room was dumped on board {digest} of {size} tiles, "
+                f"not {getattr(board, 'digest', None)} of {board.size}"
+            )
+
+        state.status = GameStatus(header["status"])
+        state.seq = header["seq"]
+        state.users = {user_id: username for user_id, username in header["users"]}
+        state.players = tuple(header["players"])
+        state.turn = header["turn"]
+        state.rolled = header["rolled"]
+        state.doubles = header["doubles"]
+        state.pending = header["pending"]
+
+        for values in (
+            state.positions,
+            state.balances,
+            state.jail_turns,
+            state.owned,
+            state.owners,
+            state.houses,
+        ):
+            size = len(values) * values.itemsize
+            values[:] = array(values.typecode, data[offset : offset + size])
+            offset += size
+        state.bankrupt[:] = data[offset : offset + MAX_PLAYERS]
+        offset += MAX_PLAYERS
+        state.mortgaged[:] = data[offset : offset + board.size]
+        offset += board.size
+        cards = header.get("cards", 0)
+        if cards:
+            state.card_order = array("B", data[offset : offset + cards])
+            offset += cards
+            state.card_next = array("B", data[offset : offset + 2])
+        return state
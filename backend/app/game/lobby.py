@@ -0,0 +1,180 @@
+import bisect
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from app.settings import settings
+from .game_state import MAX_PLAYERS
+
+# Index key of a public room
+Pool = tuple[str, int]
+
+
+def pool_for(region: str, games_played: int) -> Pool:
+    """The region and skill bracket a player is matched in."""
+    return region, bisect.bisect_right(settings.LOBBY_SKILL_BRACKETS, games_played)
+
+
+class PublicRoom:
+    __slots__ = ("game", "pool", "users", "open", "reservations")
+
+    def __init__(self, game: uuid.UUID, pool: Pool):
+        self.game = game
+        self.pool = pool
+        # Users seated in the room and whether it still takes players, as last
+        # reported by GameManager.
+        self.users: set[int] = set()
+        self.open = True
+        # user_id -> monotonic time the reserved seat is given up at
+        self.reservations: Dict[int, float] = {}
+
+    def free_seats(self, now: float) -> int:
+        for user_id, expires in list(self.reservations.items()):
+            if expires <= now or user_id in self.users:
+                del self.reservations[user_id]
+        return MAX_PLAYERS - len(self.users) - len(self.reservations)
+
+
+class Lobby:
+    """
+    Matchmaking over the public rooms, for a single worker.
+
+    Open rooms are indexed by pool (region and skill bracket) and free seats,
+    each bucket keeping rooms in the order they opened. Quick join takes the
+    oldest room with the fewest free seats, so rooms fill up and start instead
+    of many rooms waiting with one player each. A seat is reserved for the user
+    before they connect, and counts as taken until they join or it expires. A
+    user holds one reservation at a time, taking a seat gives up the last one.
+
+    Rooms created from a shared link are private and never indexed. Backends
+    shared between workers keep the same index in their store instead.
+    """
+
+    def __init__(self, reservation_seconds: float):
+        self.reservation_seconds = reservation_seconds
+        self.rooms: Dict[uuid.UUID, PublicRoom] = {}
+        # user_id -> room the user last reserved a seat in
+        self._reserved: Dict[int, uuid.UUID] = {}
+        # pool -> free seats -> rooms with that many free seats, oldest first
+        self._index: Dict[Pool, list[OrderedDict[uuid.UUID, None]]] = {}
+
+    def _bucket(self, room: PublicRoom, free: int) -> OrderedDict:
+        buckets = self._index.get(room.pool)
+        if buckets is None:
+            buckets = self._index[room.pool] = [OrderedDict() for _ in range(MAX_PLAYERS + 1)]
+        return buckets[free]
+
+    def _reindex(self, room: PublicRoom, now: float):
+        buckets = self._index.get(room.pool)
+        if buckets is not None:
+            for bucket in buckets:
+                bucket.pop(room.game, None)
+        free = room.free_seats(now)
+        if not room.open or free <= 0:
+            return
+        if free == MAX_PLAYERS:
+            # Everybody left or never came, nobody else will look for it.
+            del self.rooms[room.game]
+            return
+        self._bucket(room, free)[room.game] = None
+
+    def _reserve(self, room: PublicRoom, user_id: int, now: float):
+        previous = self.rooms.get(self._reserved.get(user_id))
+        if previous is not None and previous is not room:
+            previous.reservations.pop(user_id, None)
+            self._reindex(previous, now)
+        room.reservations[user_id] = now + self.reservation_seconds
+        self._reserved[user_id] = room.game
+        self._reindex(room, now)
+
+    def quick_join(self, user_id: int, pool: Pool) -> uuid.UUID:
+        """
+        Reserves a seat in the fullest open room of the pool, in a new room if
+        none is open, and returns the room to connect to.
+        """
+        now = time.monotonic()
+        room = self.rooms.get(self._reserved.get(user_id))
+        if room is not None and room.open and room.pool == pool:
+            room.free_seats(now)
+            # Asking again while holding a seat keeps the same one.
+            if user_id in room.reservations:
+                self._reserve(room, user_id, now)
+                return room.game
+
+        buckets = self._index.get(pool, ())
+        for free in range(1, len(buckets)):
+            bucket = buckets[free]
+            while bucket:
+                room = self.rooms[next(iter(bucket))]
+                if room.free_seats(now) != free:
+                    # Reservations ran out since it was indexed.
+                    self._reindex(room, now)
+                    continue
+                self._reserve(room, user_id, now)
+                return room.game
+
+        room = PublicRoom(uuid.uuid4(), pool)
+        self.rooms[room.game] = room
+        self._reserve(room, user_id, now)
+        return room.game
+
+    def reserve(self, game: uuid.UUID, user_id: int, pool: Pool) -> bool:
+        """
+        Reserves a seat in a given public room of the pool, False if it is in
+        another pool or has no seat free.
+        """
+        room = self.rooms.get(game)
+        if room is None or not room.open or room.pool != pool:
+            return False
+        now = time.monotonic()
+        if user_id not in room.users and user_id not in room.reservations:
+            if room.free_seats(now) <= 0:
+                return False
+        self._reserve(room, user_id, now)
+        return True
+
+    def has_seat(self, game: uuid.UUID, user_id: int, seated: int) -> bool:
+        """
+        Whether the user may take a seat in the room, next to the seated users,
+        when connecting. Seats reserved for others count as taken.
+        """
+        room = self.rooms.get(game)
+        if room is None:
+            return seated < MAX_PLAYERS
+        now = time.monotonic()
+        room.free_seats(now)
+        if user_id in room.reservations:
+            return True
+        return seated + len(room.reservations) < MAX_PLAYERS
+
+    def update(self, game: uuid.UUID, users: Iterable[int], is_open: bool):
+        """Takes in a change of the users or status of a room."""
+        room = self.rooms.get(game)
+        if room is None:
+            return
+        room.users = set(users)
+        room.open = is_open
+        self._reindex(room, time.monotonic())
+        if not room.open:
+            del self.rooms[game]
+
+    def expire(self):
+        """Gives up expired reservations and forgets rooms left empty by them."""
+        now = time.monotonic()
+        for room in list(self.rooms.values()):
+            self._reindex(room, now)
+        self._reserved = {
+            user_id: game
+            for user_id, game in self._reserved.items()
+            if game in self.rooms and user_id in self.rooms[game].reservations
+        }
+
+    def open_rooms(self, pool: Pool) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {"game": game, "free": free}
+            for free, bucket in enumerate(self._index.get(pool, ()))
+            for game in bucket
+            if self.rooms[game].free_seats(now) == free
+        ]
@@ -0,0 +1,177 @@
+"""
+Long-run landing probabilities of the board, solved as a Markov chain.
+
+A state is the position of a token together with the doubles rolled in a row
+(0-2), plus one state per turn spent in jail (1-3). The chain follows the
+engine rules: three doubles or the Go To Jail tile send a token to jail, a
+double or the third turn lets it out, and a card drawn on Chance or Community
+Chest may move it again.
+
+Landings are counted the way the simulator counts "move" events: a token
+sent on by Go To Jail or a card lands on both tiles, and turns spent in jail
+without leaving are not landings.
+"""
+
+from typing import Callable, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .board import BoardSnapshot
+from .engine import (
+    ADVANCE,
+    BACK,
+    BoardTables,
+    CHANCE,
+    CHEST,
+    GO_TO_JAIL,
+    GOTO_JAIL,
+    MAX_DOUBLES,
+    MAX_JAIL_TURNS,
+    NEAREST,
+    nearest,
+)
+
+# A card as seen by the chain: where a token drawing it at a position ends up.
+CardMove = Callable[[int], int]
+# Returned by a CardMove for cards sending the token to jail.
+SENT_TO_JAIL = -1
+
+# Probability of each dice total with two dice, and of that total being a double.
+ROLLS = [(total, 6 - abs(total - 7), 1 if total % 2 == 0 else 0) for total in range(2, 13)]
+
+_cache: Dict[int, np.ndarray] = {}
+CACHE_SIZE = 4
+
+
+def card_moves(tables: BoardTables) -> Dict[int, list[CardMove]]:
+    """
+    The compiled decks of a board as CardMoves keyed by tile kind. Cards that
+    only move money keep the token where it is. A card moving the token back
+    onto another card tile is not followed further.
+    """
+    size = tables.size
+
+    def move(card) -> CardMove:
+        if card.op == ADVANCE:
+            return lambda position: card.args[0]
+        if card.op == NEAREST:
+            return lambda position: nearest(tables, position, card.args[0])
+        if card.op == BACK:
+            return lambda position: (position - card.args[0]) % size
+        if card.op == GO_TO_JAIL:
+            return lambda position: SENT_TO_JAIL
+        return lambda position: position
+
+    return {
+        CHANCE + deck: [move(card) for card in cards]
+        for deck, cards in enumerate(tables.decks)
+    }
+
+
+def transition_matrix(
+    tables: BoardTables, decks: Optional[Mapping[int, Sequence[CardMove]]] = None
+) -> np.ndarray:
+    """
+    Row-stochastic matrix over MAX_DOUBLES * size + MAX_JAIL_TURNS states:
+    state doubles * size + position, then the jail states.
+    """
+    return _chain(tables, decks)[0]
+
+
+def _chain(
+    tables: BoardTables, decks: Optional[Mapping[int, Sequence[CardMove]]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The transition matrix, and for every state the expected landings on each
+    tile during the roll leaving it.
+    """
+    size = tables.size
+    jail = MAX_DOUBLES * size
+    matrix = np.zeros((jail + MAX_JAIL_TURNS, jail + MAX_JAIL_TURNS))
+    landings = np.zeros((jail + MAX_JAIL_TURNS, size))
+    decks = decks or {}
+
+    def outcomes(tile: int) -> list[tuple[int, float]]:
+        """Where a token landing on tile ends up, as (tile or jail, probability)."""
+        kind = tables.kind[tile]
+        if kind == GOTO_JAIL:
+            return [(SENT_TO_JAIL, 1.0)]
+        deck = decks.get(kind) if kind in (CHANCE, CHEST) else None
+        if not deck:
+            return [(tile, 1.0)]
+        share = 1.0 / len(deck)
+        return [(card(tile), share) for card in deck]
+
+    landing = [outcomes(tile) for tile in range(size)]
+
+    def add_move(row: int, position: int, steps: int, doubles: int, p: float):
+        tile = (position + steps) % size
+        landings[row, tile] += p
+        for target, q in landing[tile]:
+            if target == SENT_TO_JAIL:
+                matrix[row, jail] += p * q
+                landings[row, tables.jail] += p * q
+            else:
+                matrix[row, doubles * size + target] += p * q
+                if target != tile:
+                    landings[row, target] += p * q
+
+    for doubles in range(MAX_DOUBLES):
+        for position in range(size):
+            row = doubles * size + position
+            for total, ways, double_ways in ROLLS:
+                single = (ways - double_ways) / 36
+                double = double_ways / 36
+                if single:
+                    add_move(row, position, total, 0, single)
+                if double:
+                    if doubles + 1 >= MAX_DOUBLES:
+                        matrix[row, jail] += double
+                        landings[row, tables.jail] += double
+                    else:
+                        add_move(row, position, total, doubles + 1, double)
+
+    for turn in range(MAX_JAIL_TURNS):
+        row = jail + turn
+        for total, ways, double_ways in ROLLS:
+            # Leaving jail never grants another roll.
+            if turn + 1 >= MAX_JAIL_TURNS:
+                add_move(row, tables.jail, total, 0, ways / 36)
+            else:
+                add_move(row, tables.jail, total, 0, double_ways / 36)
+                matrix[row, row + 1] += (ways - double_ways) / 36
+    return matrix, landings
+
+
+def stationary(matrix: np.ndarray) -> np.ndarray:
+    """Solves pi @ matrix = pi with pi summing to one."""
+    states = len(matrix)
+    system = matrix.T - np.eye(states)
+    system[-1] = 1.0
+    rhs = np.zeros(states)
+    rhs[-1] = 1.0
+    return np.linalg.solve(system, rhs)
+
+
+def landing_probabilities(
+    tables: BoardTables, decks: Optional[Mapping[int, Sequence[CardMove]]] = None
+) -> np.ndarray:
+    """
+    Share of landings on each tile. Go To Jail counts the token arriving on
+    it, and jail counts every token sent there.
+    """
+    matrix, landings = _chain(tables, decks)
+    tiles = stationary(matrix) @ landings
+    return tiles / tiles.sum()
+
+
+def for_board(board: BoardSnapshot) -> np.ndarray:
+    """Landing probabilities of a board snapshot, computed once per board version."""
+    probabilities = _cache.get(board.version)
+    if probabilities is None:
+        probabilities = landing_probabilities(board.tables, card_moves(board.tables))
+        probabilities.flags.writeable = False
+        _cache[board.version] = probabilities
+        while len(_cache) > CACHE_SIZE:
+            del _cache[min(_cache)]
+    return probabilities
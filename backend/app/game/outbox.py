@@ -0,0 +1,91 @@
+import asyncio
+import enum
+from collections import deque
+from typing import Union
+
+Frame = Union[str, bytes]
+
+
+class FrameKind(enum.Enum):
+    event = "event"
+    chat = "chat"
+    state = "state"
+
+
+class OverflowPolicy(enum.Enum):
+    # Discard the oldest queued chat frame, disconnect if there is none.
+    drop_chat = "drop_chat"
+    # Replace the queued state snapshot with the newer one, otherwise as drop_chat.
+    coalesce = "coalesce"
+    # Disconnect as soon as the queue is full.
+    disconnect = "disconnect"
+
+
+class OutboxOverflow(Exception):
+    pass
+
+
+class Outbox:
+    """
+    Bounded queue of encoded frames waiting to be written to one WebSocket.
+    Putting never blocks: when the queue is full the overflow policy decides
+    which frame is given up, or raises OutboxOverflow to drop the connection.
+    """
+
+    __slots__ = ("maxsize", "policy", "dropped", "_frames", "_ready")
+
+    def __init__(self, maxsize: int, policy: OverflowPolicy):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._frames: deque[tuple[FrameKind, Frame]] = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def put(self, frame: Frame, kind: FrameKind = FrameKind.event) -> bool:
+        """Queue a frame, returns False if the frame itself was dropped."""
+        if len(self._frames) >= self.maxsize and not self._make_room(kind):
+            self.dropped += 1
+            return False
+        self._frames.append((kind, frame))
+        self._ready.set()
+        return True
+
+    async def get(self) -> Frame:
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()[1]
+
+    def drain(self, limit: int) -> list[Frame]:
+        """Takes up to limit frames that are already queued, without waiting."""
+        frames = []
+        while self._frames and len(frames) < limit:
+            frames.append(self._frames.popleft()[1])
+        return frames
+
+    def _remove_oldest(self, kind: FrameKind) -> bool:
+        for i, (queued_kind, _) in enumerate(self._frames):
+            if queued_kind is kind:
+                del self._frames[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _make_room(self, kind: FrameKind) -> bool:
+        if self.policy is OverflowPolicy.disconnect:
+            raise OutboxOverflow(f"Outbox full ({self.maxsize} frames)")
+
+        if self.policy is OverflowPolicy.coalesce and kind is FrameKind.state:
+            if self._remove_oldest(FrameKind.state):
+                return True
+
+        if self._remove_oldest(FrameKind.chat):
+            return True
+        if kind is FrameKind.chat:
+            # Nothing older to give up, drop the incoming chat message instead.
+            return False
+
+        raise OutboxOverflow(f"Outbox full ({self.maxsize} frames)")
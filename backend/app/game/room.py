@@ -0,0 +1,100 @@
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from app.settings import settings
+
+Handler = Callable[..., Awaitable]
+
+
+class Room:
+    """
+    Actor running the commands of one room.
+    Connects, messages and disconnects of every socket in the room are queued
+    and run one at a time by a single task, so a command never sees the room
+    half way through another one and handlers need no locks.
+    """
+
+    __slots__ = (
+        "game",
+        "queue",
+        "task",
+        "processed",
+        "failed",
+        "busy",
+        "slowest",
+    )
+
+    def __init__(self, game: uuid.UUID):
+        self.game = game
+        self.queue: asyncio.Queue[
+            tuple[Handler, tuple, Optional[asyncio.Future]]
+        ] = asyncio.Queue(settings.ROOM_QUEUE_SIZE)
+        self.task: Optional[asyncio.Task] = None
+        # Commands run so far, how many raised, and the time spent running them.
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.slowest = 0.0
+
+    async def call(self, handler: Handler, *args):
+        """Queues a command and waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((handler, args, future))
+        return await future
+
+    async def post(self, handler: Handler, *args):
+        """Queues a command without waiting for it, only waits for queue space."""
+        await self.queue.put((handler, args, None))
+
+    async def run(
+        self,
+        hold: Callable[[uuid.UUID], None],
+        flush: Callable[[uuid.UUID], None],
+        is_idle: Callable[[uuid.UUID], bool],
+    ):
+        """
+        Runs queued commands until the queue is empty and is_idle says nobody
+        is left in the room. Frames a command sends are held and flushed once
+        it is done, so each socket gets them together.
+        """
+        while True:
+            handler, args, future = await self.queue.get()
+            hold(self.game)
+            started = time.perf_counter()
+            try:
+                result = await handler(self.game, *args)
+            except Exception as e:
+                self.failed += 1
+                if future is None:
+                    logger.error(f"Command {handler.__name__} failed in game {self.game}: {e!r}")
+                elif not future.done():
+                    future.set_exception(e)
+            else:
+                if future is not None and not future.done():
+                    future.set_result(result)
+            finally:
+                flush(self.game)
+
+            elapsed = time.perf_counter() - started
+            self.processed += 1
+            self.busy += elapsed
+            self.slowest = max(self.slowest, elapsed)
+            if elapsed >= settings.ROOM_SLOW_COMMAND:
+                logger.warning(
+                    f"Command {handler.__name__} took {elapsed:.3f}s in game {self.game}"
+                )
+            if self.queue.empty() and is_idle(self.game):
+                return
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy": round(self.busy, 6),
+            "slowest": round(self.slowest, 6),
+        }
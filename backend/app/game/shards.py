@@ -0,0 +1,293 @@
+"""
+Rooms sharded onto worker processes.
+
+With GAME_SHARDS set, the rules of every room run in one of that many child
+processes, picked by the game id, while the process serving the WebSockets only
+does I/O. A request over the shard's pipe is the logged action of a room, the
+reply its events and the new state in the GameState.dumps form, so the front
+keeps an up to date copy for reading without running the rules itself.
+
+A shard is sent a room's state only when its copy is missing or behind, and
+the board tables once per board version. A shard that dies is started again
+with nothing, its rooms are sent again with their next action.
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import signal
+import uuid
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Sequence
+
+from loguru import logger
+
+from app.settings import settings
+from . import engine
+from .engine import BoardTables, GameRuleError
+from .game_state import GameState
+
+# Reply status
+OK = 0
+RULE_ERROR = 1
+ERROR = 2
+
+
+def _serve(conn: Connection):
+    """Main loop of a shard process, answers requests until the pipe closes."""
+    # Ctrl+C reaches the whole process group, the parent decides when we stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    boards: Dict[int, BoardTables] = {}
+    games: Dict[uuid.UUID, GameState] = {}
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        request_id, op, game, args = request
+        try:
+            if op == "apply":
+                version, action, tables, data = args
+                if tables is not None:
+                    boards[version] = tables
+                tables = boards[version]
+                if data is not None:
+                    games[game] = GameState.loads(data, tables)
+                state = games[game]
+                events = engine.apply(tables, state, action)
+                reply = (request_id, OK, (events, state.dumps()))
+            elif op == "forget":
+                games.pop(game, None)
+                reply = (request_id, OK, None)
+            else:
+                raise ValueError(f"Unknown shard request {op!r}")
+        except GameRuleError as e:
+            # The engine checks an action before changing anything.
+            reply = (request_id, RULE_ERROR, str(e))
+        except Exception as e:
+            # Whatever the copy went through, the front will send it again.
+            games.pop(game, None)
+            reply = (request_id, ERROR, f"{type(e).__name__}: {e}")
+        conn.send(reply)
+
+
+def _send_all(conn: Connection, requests: list):
+    for request in requests:
+        conn.send(request)
+
+
+class Shard:
+    __slots__ = (
+        "index",
+        "process",
+        "conn",
+        "boards",
+        "synced",
+        "applied",
+        "restarts",
+        "pending",
+        "outbox",
+        "writer",
+    )
+
+    def __init__(self, index: int, process: multiprocessing.Process, conn: Connection):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        # Board versions the shard has, and the seq of each room it holds.
+        self.boards: set[int] = set()
+        self.synced: Dict[uuid.UUID, int] = {}
+        self.applied = 0
+        self.restarts = 0
+        # Requests sent and waiting for their reply, and those not sent yet.
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.outbox: asyncio.Queue[tuple[int, tuple, asyncio.Future]] = asyncio.Queue()
+        self.writer: Optional[asyncio.Task] = None
+
+    def fail(self, error: Exception):
+        """Fails every request of the shard that is still waiting."""
+        futures = list(self.pending.values())
+        self.pending.clear()
+        while not self.outbox.empty():
+            futures.append(self.outbox.get_nowait()[2])
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+
+class ShardPool:
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._shards: List[Shard] = []
+        self._context = None
+        self._ids = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    async def start(self):
+        if not self.enabled:
+            return
+        # Forking a process with a running event loop and threads is not safe.
+        self._context = multiprocessing.get_context("spawn")
+        self._shards = [self._spawn(index) for index in range(self.processes)]
+        logger.info(f"Started {self.processes} game shard processes")
+
+    def _spawn(self, index: int) -> Shard:
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve, args=(child,), name=f"game-shard-{index}", daemon=True
+        )
+        process.start()
+        child.close()
+        shard = Shard(index, process, parent)
+        loop = asyncio.get_running_loop()
+        loop.add_reader(parent.fileno(), self._read, shard)
+        shard.writer = loop.create_task(self._write(shard))
+        return shard
+
+    def _close(self, shard: Shard):
+        asyncio.get_running_loop().remove_reader(shard.conn.fileno())
+        shard.writer.cancel()
+
+    async def stop(self):
+        for shard in self._shards:
+            self._close(shard)
+            try:
+                shard.conn.send(None)
+            except OSError:
+                pass
+            shard.conn.close()
+            shard.fail(ConnectionError("Game shards stopped"))
+        for shard in self._shards:
+            await asyncio.to_thread(shard.process.join, 5)
+            if shard.process.is_alive():
+                shard.process.kill()
+        self._shards = []
+
+    def shard(self, game: uuid.UUID) -> Shard:
+        return self._shards[game.int % len(self._shards)]
+
+    def _read(self, shard: Shard):
+        try:
+            while shard.conn.poll():
+                request_id, status, result = shard.conn.recv()
+                future = shard.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == OK:
+                    future.set_result(result)
+                elif status == RULE_ERROR:
+                    future.set_exception(GameRuleError(result))
+                else:
+                    future.set_exception(RuntimeError(result))
+        except (EOFError, OSError) as e:
+            logger.error(f"Game shard {shard.process.name} is gone: {e!r}")
+            self._respawn(shard)
+
+    def _respawn(self, shard: Shard):
+        """Replaces a dead shard, its rooms are sent again with their next action."""
+        self._close(shard)
+        shard.conn.close()
+        if shard.process.is_alive():
+            shard.process.kill()
+        shard.fail(ConnectionError("Game shard is gone"))
+        replacement = self._spawn(shard.index)
+        replacement.restarts = shard.restarts + 1
+        self._shards[shard.index] = replacement
+
+    async def _write(self, shard: Shard):
+        """
+        Sends the shard's requests in order. A pipe write blocks once the
+        shard falls behind, so it is done in a thread, with everything queued
+        meanwhile sent in one go.
+        """
+        while True:
+            batch = [await shard.outbox.get()]
+            while not shard.outbox.empty():
+                batch.append(shard.outbox.get_nowait())
+            # Registered first, the reply may be read before the thread returns.
+            for request_id, _, future in batch:
+                shard.pending[request_id] = future
+            try:
+                await asyncio.to_thread(
+                    _send_all, shard.conn, [request for _, request, _ in batch]
+                )
+            except Exception as e:
+                if isinstance(e, (OSError, ValueError)):
+                    # The reader notices the closed pipe and replaces the shard.
+                    error = ConnectionError(f"Game shard is gone: {e!r}")
+                else:
+                    # E.g. a request that cannot be pickled. Requests before it
+                    # may have been sent, their replies are dropped, and their
+                    # rooms and board tables are sent again with the next action.
+                    logger.error(f"Sending to game shard {shard.index} failed: {e!r}")
+                    error = RuntimeError(f"Sending to game shard failed: {e!r}")
+                    shard.boards.clear()
+                for request_id, _, future in batch:
+                    shard.pending.pop(request_id, None)
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _request(self, shard: Shard, op: str, game: uuid.UUID, args) -> asyncio.Future:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        shard.outbox.put_nowait((request_id, (request_id, op, game, args), future))
+        return future
+
+    async def apply(
+        self, game: uuid.UUID, state: GameState, action: Sequence
+    ) -> tuple[list[engine.Event], bytes]:
+        """
+        Applies an action to the shard's copy of the room, sending it the state
+        first if its copy is missing or behind. Returns the events and the new
+        state, raises GameRuleError like engine.apply.
+        """
+        shard = self.shard(game)
+        tables = state.board.tables
+        version = state.board.version
+        board = tables if version not in shard.boards else None
+        data = state.dumps() if shard.synced.get(game) != state.seq else None
+        shard.boards.add(version)
+        shard.synced.pop(game, None)
+        try:
+            events, dumped = await self._request(
+                shard, "apply", game, (version, list(action), board, data)
+            )
+        except GameRuleError:
+            shard.synced[game] = state.seq
+            raise
+        shard.synced[game] = state.seq + 1
+        shard.applied += 1
+        return events, dumped
+
+    def forget(self, game: uuid.UUID):
+        """Drops the shard's copy of a room that left this worker."""
+        if not self.enabled:
+            return
+        shard = self.shard(game)
+        if shard.synced.pop(game, None) is not None:
+            # Nobody waits for the reply, a gone shard forgot the room anyway.
+            self._request(shard, "forget", game, None).add_done_callback(
+                lambda future: future.cancelled() or future.exception()
+            )
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "name": shard.process.name,
+                "alive": shard.process.is_alive(),
+                "rooms": len(shard.synced),
+                "applied": shard.applied,
+                "restarts": shard.restarts,
+            }
+            for shard in self._shards
+        ]
+
+
+shard_pool = ShardPool(settings.GAME_SHARDS)
@@ -0,0 +1,292 @@
+"""
+Headless Monte Carlo simulation of the board and cards in app.game.data.
+
+    python -m app.game.simulator --games 100000 --bots buyer,builder,cautious
+
+Scripted bots play through the same engine rules as real rooms, in batches
+spread over worker processes. Prints how often each tile is landed on and what
+each tile returns on the money put into it.
+
+Only the work around the rules is vectorized: dice for a whole batch are drawn
+as one NumPy array and landings are counted with bincount. Moves themselves are
+played one game at a time through engine.roll, since where a player ends up
+depends on jail, cards and what the bots bought, which differs per game. Doing
+them as arrays would mean a second copy of the rules. For landing odds alone,
+markov.landing_probabilities solves the board without playing it.
+"""
+
+import argparse
+import csv
+import sys
+import time
+from array import array
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .data import cards, tiles
+from .engine import (
+    BoardTables,
+    GameRuleError,
+    PROPERTY,
+    MAX_HOUSES,
+    roll,
+    buy,
+    build,
+    end_turn,
+    owns_group,
+    shuffle_decks,
+)
+from .game_state import GameState, GameStatus, MAX_PLAYERS, NO_OWNER
+
+CAUTIOUS_RESERVE = 300
+
+_tables: Optional[BoardTables] = None
+
+
+def _attempt(events: list, action, *args) -> bool:
+    try:
+        events.extend(action(*args))
+    except GameRuleError:
+        return False
+    return True
+
+
+def _build_all(tables: BoardTables, state: GameState, seat: int, reserve: int) -> list:
+    """Builds evenly over every complete group while money stays above reserve."""
+    events: list = []
+    sites = [
+        tile
+        for tile in range(tables.size)
+        if state.owners[tile] == seat
+        and tables.kind[tile] == PROPERTY
+        and owns_group(tables, state, seat, tile)
+    ]
+    for _ in range(MAX_HOUSES if sites else 0):
+        built = False
+        for tile in sites:
+            if state.balances[seat] - tables.house_price[tile] >= reserve:
+                built |= _attempt(events, build, tables, state, seat, tile)
+        if not built:
+            break
+    return events
+
+
+def buyer(tables: BoardTables, state: GameState, seat: int) -> list:
+    """Buys everything it can afford and never builds."""
+    events: list = []
+    if state.pending != NO_OWNER:
+        _attempt(events, buy, tables, state, seat)
+    return events
+
+
+def builder(tables: BoardTables, state: GameState, seat: int) -> list:
+    """Buys everything it can afford and builds as soon as a group is complete."""
+    events = buyer(tables, state, seat)
+    events.extend(_build_all(tables, state, seat, 0))
+    return events
+
+
+def cautious(tables: BoardTables, state: GameState, seat: int) -> list:
+    """Like builder, but always keeps CAUTIOUS_RESERVE in cash."""
+    events: list = []
+    tile = state.pending
+    if tile != NO_OWNER and state.balances[seat] - tables.price[tile] >= CAUTIOUS_RESERVE:
+        _attempt(events, buy, tables, state, seat)
+    events.extend(_build_all(tables, state, seat, CAUTIOUS_RESERVE))
+    return events
+
+
+BOTS: Dict[str, Callable[[BoardTables, GameState, int], list]] = {
+    "buyer": buyer,
+    "builder": builder,
+    "cautious": cautious,
+}
+
+
+class Stats:
+    """Totals of a number of games, batches from all workers are summed up."""
+
+    def __init__(self, size: int, players: int):
+        self.games = 0
+        self.finished = 0
+        self.rolls = 0
+        self.landings = np.zeros(size, dtype=np.int64)
+        self.rent = np.zeros(size, dtype=np.int64)
+        self.invested = np.zeros(size, dtype=np.int64)
+        self.wins = np.zeros(players, dtype=np.int64)
+
+    def __iadd__(self, other: "Stats") -> "Stats":
+        self.games += other.games
+        self.finished += other.finished
+        self.rolls += other.rolls
+        self.landings += other.landings
+        self.rent += other.rent
+        self.invested += other.invested
+        self.wins += other.wins
+        return self
+
+
+def _init_worker():
+    global _tables
+    _tables = BoardTables.from_data(tiles, cards)
+
+
+def play_batch(
+    games: int, bots: List[str], seed: np.random.SeedSequence, max_rolls: int
+) -> Stats:
+    tables = _tables or BoardTables.from_data(tiles, cards)
+    strategies = [BOTS[name] for name in bots]
+    stats = Stats(tables.size, len(bots))
+    rent = [0] * tables.size
+    invested = [0] * tables.size
+    landed = array("B")
+
+    rng = np.random.default_rng(seed)
+    dice = rng.integers(1, 7, size=(games, max_rolls, 2), dtype=np.uint8)
+    deals = rng.integers(2**32, size=games).tolist()
+    # Each game branches on its own state, see the module docstring.
+    for game_dice, deal in zip(dice, deals):
+        rolls = game_dice.tolist()
+        state = GameState(tables)
+        for seat, name in enumerate(bots):
+            state.add_user(seat, name)
+        state.start()
+        shuffle_decks(tables, state, deal)
+
+        used = 0
+        while state.status is GameStatus.started and used < max_rolls:
+            seat = state.turn
+            if state.rolled or state.bankrupt[seat]:
+                end_turn(tables, state, seat)
+                continue
+            dice1, dice2 = rolls[used]
+            used += 1
+            events = roll(tables, state, seat, dice1, dice2)
+            if not state.bankrupt[seat]:
+                events.extend(strategies[seat](tables, state, seat))
+
+            for event in events:
+                match event[0]:
+                    case "move":
+                        landed.append(event[3])
+                    case "rent":
+                        rent[event[3]] += event[4]
+                    case "owner":
+                        invested[event[1]] += tables.price[event[1]]
+                    case "houses":
+                        invested[event[1]] += tables.house_price[event[1]]
+
+        stats.games += 1
+        stats.rolls += used
+        if state.status is GameStatus.finished:
+            stats.finished += 1
+            stats.wins[state.bankrupt.index(0)] += 1
+
+    stats.landings += np.bincount(
+        np.frombuffer(landed, dtype=np.uint8), minlength=tables.size
+    )
+    stats.rent += rent
+    stats.invested += invested
+    return stats
+
+
+def _play_batch(args) -> Stats:
+    return play_batch(*args)
+
+
+def simulate(
+    games: int,
+    bots: List[str],
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    batch_size: int = 1000,
+    max_rolls: int = 1000,
+) -> Stats:
+    """Plays games in batches over a process pool, returns the summed stats."""
+    sizes = [batch_size] * (games // batch_size)
+    if games % batch_size:
+        sizes.append(games % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(size, bots, s, max_rolls) for size, s in zip(sizes, seeds)]
+
+    stats = Stats(BoardTables.from_data(tiles).size, len(bots))
+    with Pool(workers, initializer=_init_worker) as pool:
+        for batch in pool.imap_unordered(_play_batch, jobs):
+            stats += batch
+    return stats
+
+
+def tile_rows(stats: Stats) -> list[dict]:
+    tables = BoardTables.from_data(tiles)
+    names = {tile["tile_position"]: tile["name"] for tile in tiles}
+    total = max(int(stats.landings.sum()), 1)
+    rows = []
+    for index in range(tables.size):
+        invested = int(stats.invested[index])
+        rows.append(
+            {
+                "tile": index,
+                "name": names.get(index, ""),
+                "landed": stats.landings[index] / total,
+                "price": tables.price[index],
+                "rent_per_game": stats.rent[index] / max(stats.games, 1),
+                "roi": stats.rent[index] / invested if invested else None,
+            }
+        )
+    return rows
+
+
+def print_table(stats: Stats, bots: List[str]):
+    print(
+        f"{stats.games} games, {stats.finished} finished, "
+        f"{stats.rolls / max(stats.games, 1):.0f} rolls per game"
+    )
+    for seat, name in enumerate(bots):
+        print(f"  seat {seat} {name:<10} won {stats.wins[seat]}")
+    print()
+    print(f"{'tile':>4}  {'name':<28}{'landed':>8}{'price':>7}{'rent/game':>11}{'roi':>8}")
+    for row in tile_rows(stats):
+        roi = f"{row['roi']:.2f}" if row["roi"] is not None else "-"
+        print(
+            f"{row['tile']:>4}  {row['name']:<28}{row['landed']:>8.2%}"
+            f"{row['price']:>7}{row['rent_per_game']:>11.1f}{roi:>8}"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument(
+        "--bots",
+        default="buyer,builder",
+        help=f"comma separated, 2 to {MAX_PLAYERS} of: {', '.join(BOTS)}",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-rolls", type=int, default=1000, help="per game")
+    parser.add_argument("--csv", action="store_true", help="print tile rows as CSV")
+    args = parser.parse_args(argv)
+
+    bots = args.bots.split(",")
+    if not 2 <= len(bots) <= MAX_PLAYERS or any(bot not in BOTS for bot in bots):
+        parser.error(f"--bots needs 2 to {MAX_PLAYERS} of: {', '.join(BOTS)}")
+
+    started = time.perf_counter()
+    stats = simulate(
+        args.games, bots, args.workers, args.seed, args.batch_size, args.max_rolls
+    )
+    if args.csv:
+        rows = tile_rows(stats)
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        print_table(stats, bots)
+        print(f"\n{time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
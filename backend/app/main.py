@@ -7,9 +7,12 @@ from loguru import logger
 from settings import settings
 
 from app.user.api import router as user_router
-from app.game.api import router as game_router
+from app.game.api import router as game_router, manager as game_manager
 
-from app.game import load_game_data, reload_game_data
+from app.game.game_data_loader import load_game_data, reload_game_data
+from app.database import db_helper
+from app.user.hash import password_hasher
+from app.game.deflate import install as install_deflate
 
 from utils import validation_exception_handler
 
@@ -20,14 +23,20 @@ logger.add(
     retention="7 days",
 )
 
+install_deflate(settings.WS_COMPRESS_THRESHOLD)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up the application")
     await load_game_data()
+    await game_manager.start()
 
     yield
     logger.info("Shutting down the application")
+    await game_manager.stop()
+    await db_helper.engine.dispose()
+    password_hasher.shutdown()
 
 
 app = FastAPI(
@@ -56,7 +65,7 @@ async def root():
 
 @app.post("/reload")
 async def reload():
-    await reload_game_data()
+    await reload_game_data(game_manager.backend)
     return {"message": "Game data reloaded"}
 
 
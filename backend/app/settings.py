@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl
 from pathlib import Path
@@ -25,6 +25,12 @@ class Settings(BaseSettings):
 
     # JWT settings
     ACCESS_TOKEN_EXPIRE_SECONDS: int
+    # Verified tokens kept in memory, so repeated requests skip jwt.decode.
+    TOKEN_CACHE_SIZE: int = 10_000
+
+    # Password hashing settings
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
 
     # SMTP settings
     SMTP_USER: str
@@ -45,6 +51,15 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    # Connection pool settings, sizes are per worker process.
+    # "external" is for running behind pgbouncer in transaction mode.
+    DB_POOL_MODE: Literal["pooled", "null", "external"] = "pooled"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
     # Mail settings
     VERIFY_MAIL_PATH: str
 
@@ -58,6 +73,62 @@ class Settings(BaseSettings):
     def PASSWORD_RESET_URL(self) -> str:
         return f"https://{self.DOMAIN}{self.PASSWORD_RESET_PATH}"
 
+    # Game WebSocket settings
+    WS_SEND_TIMEOUT: float = 5.0
+    WS_QUEUE_SIZE: int = 64
+    WS_OVERFLOW_POLICY: Literal["drop_chat", "coalesce", "disconnect"] = "coalesce"
+    # Frames shorter than this skip permessage-deflate, 0 compresses everything.
+    WS_COMPRESS_THRESHOLD: int = 512
+    # Send frames queued within the window as one array frame, 0 batches what
+    # was queued in the same event loop tick.
+    WS_BATCH_FRAMES: bool = False
+    WS_BATCH_WINDOW: float = 0.0
+    WS_BATCH_MAX_FRAMES: int = 32
+    # Reconnecting clients get the deltas they missed if the room still has them.
+    # Resume tokens are sent again on every connect and never outlive the
+    # access token.
+    WS_RESUME_TOKEN_MAX_AGE: int = 5 * 60
+    WS_RESUME_BUFFER: int = 256
+
+    # Where rooms live: "memory" for a single worker, "redis" to share them
+    # between workers through REDIS_URL.
+    ROOM_BACKEND: Literal["memory", "redis"] = "memory"
+    ROOM_STATE_TTL: int = 24 * 60 * 60
+    ROOM_LEASE_SECONDS: int = 15
+    # Name the reverse proxy routes to this worker's node by, advertised in room
+    # leases so clients can be sent to the owner. Defaults to the hostname.
+    NODE_NAME: str = ""
+    # Commands waiting in a room's actor before sockets stop reading, and the
+    # run time over which a command is logged as slow.
+    ROOM_QUEUE_SIZE: int = 256
+    ROOM_SLOW_COMMAND: float = 0.5
+    # Processes running the game rules of this worker's rooms, 0 runs them in
+    # the event loop. Rooms are spread over them by game id.
+    GAME_SHARDS: int = 0
+    # Rooms nobody used for ROOM_IDLE_TTL seconds are dropped from memory, and
+    # the least recently used idle rooms once all of them take more than
+    # ROOM_MEMORY_BUDGET bytes (0 for no budget). Dropped rooms are restored
+    # from the game log when somebody connects again.
+    ROOM_IDLE_TTL: int = 15 * 60
+    ROOM_MEMORY_BUDGET: int = 0
+    ROOM_SWEEP_INTERVAL: float = 60.0
+
+    # Matchmaking, public rooms are matched by region and by the bracket of
+    # games played, seats reserved for a player are kept for this many seconds.
+    LOBBY_REGIONS: List[str] = ["default"]
+    LOBBY_SKILL_BRACKETS: List[int] = [10, 50]
+    LOBBY_RESERVATION_SECONDS: float = 30.0
+
+    # Game log, actions are written in batches and replayed to restore rooms.
+    GAME_LOG_FLUSH_INTERVAL: float = 1.0
+    GAME_LOG_BATCH_SIZE: int = 500
+    GAME_LOG_SNAPSHOT_EVERY: int = 50
+    # Actions kept for retrying while the database cannot be written
+    GAME_LOG_MAX_PENDING: int = 100_000
+    # Only rooms known to have a log are restored from it. Shared backends keep
+    # knowing it for this many seconds after the room was last written.
+    GAME_LOG_TTL: int = 30 * 24 * 60 * 60
+
     BASE_DIR: Path = Path(__file__).resolve().parent
     ROOT_DIR: Path = Path(__file__).resolve().parent.parent
 
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, status, BackgroundTasks, HTTPException,
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import db_helper
 from .cookie import oauth2_scheme
-from .hash import get_password_hash
+from .hash import get_password_hash, password_hasher
 from .schemas import (
     UserRegister,
     URLToken,
@@ -60,7 +60,7 @@ async def register(
             )
 
     user_data = user_data.model_dump(exclude={"confirm_password"})
-    user_data["password"] = get_password_hash(user_data["password"])
+    user_data["password"] = await get_password_hash(user_data["password"])
 
     user = User(**user_data)
 
@@ -138,6 +138,11 @@ async def login(
     )
 
 
+@router.get("/metrics")
+async def metrics():
+    return {"password_hasher": password_hasher.stats()}
+
+
 @router.post("/logout")
 async def logout(response: Response):
     response.delete_cookie("access_token")
@@ -181,7 +186,7 @@ async def password_reset_verify(
             detail="Invalid token",
         )
 
-    user.password = get_password_hash(data.password)
+    user.password = await get_password_hash(data.password)
     await session.commit()
 
     return ResponseModel(message="Password reset successful")
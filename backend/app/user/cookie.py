@@ -25,7 +25,6 @@ class OAuth2PasswordBearerWithCookie(OAuth2):
         authorization: str = request.cookies.get(
             "access_token"
         )  # changed to accept access token from httpOnly Cookie
-        print("access_token is", authorization)
 
         scheme, param = get_authorization_scheme_param(authorization)
         if not authorization or scheme.lower() != "bearer":
@@ -1,14 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
+from app.settings import settings
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded thread pool. bcrypt releases the GIL while hashing,
+    so the event loop keeps serving requests and game sockets meanwhile.
+    """
+
+    def __init__(self, rounds: int, workers: int):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        # The executor runs at most `workers` jobs, the rest wait in its queue.
+        self.submitted = 0
+        self.completed = 0
+
+    def stats(self) -> dict:
+        queued = self.submitted - self.completed
+        running = min(queued, self.workers)
+        return {
+            "workers": self.workers,
+            "waiting": queued - running,
+            "running": running,
+            "completed": self.completed,
+        }
+
+    async def _run(self, func, *args):
+        self.submitted += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.completed += 1
+
+    def _hash(self, password: str) -> str:
+        # Generate a salt and hash the password
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+    @staticmethod
+    def _verify(plain_password: str, hashed_password: str) -> bool:
+        # Check if the plain password matches the hashed password
+        return bcrypt.checkpw(
+            plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self._verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(settings.BCRYPT_ROUNDS, settings.PASSWORD_HASH_WORKERS)
+
 
-def get_password_hash(password: str) -> str:
-    # Generate a salt and hash the password
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Check if the plain password matches the hashed password
-    return bcrypt.checkpw(
-        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
-    )
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
@@ -1,3 +1,6 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 import jwt
 from itsdangerous import URLSafeTimedSerializer
@@ -7,6 +10,61 @@ from loguru import logger
 from app.settings import settings
 
 serializer = URLSafeTimedSerializer(secret_key=settings.SECRET_KEY, salt="mail")
+resume_serializer = URLSafeTimedSerializer(
+    secret_key=settings.SECRET_KEY, salt="game-resume"
+)
+
+
+class TokenCache:
+    """
+    LRU of verified tokens and their claims.
+    Entries are dropped once the token expires, so a cached token is never
+    accepted for longer than jwt.decode would accept it.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._next_sweep = 0.0
+
+    def get(self, token: str) -> dict | None:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, claims = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: dict):
+        expires_at = claims.get("exp")
+        if expires_at is None or self.maxsize <= 0:
+            return
+        self._entries[token] = (float(expires_at), claims)
+        self._entries.move_to_end(token)
+        if len(self._entries) > self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops expired entries, at most once a minute since that walks the whole
+        cache, then the least recently used ones.
+        """
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + 60
+            for token in [t for t, (exp, _) in self._entries.items() if exp <= now]:
+                del self._entries[token]
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
 
 
 def create_token(data: dict):
@@ -20,10 +78,14 @@ def create_token(data: dict):
 
 
 def decode_token(token: str) -> dict:
+    claims = token_cache.get(token)
+    if claims is not None:
+        return dict(claims)
     try:
         token_data = jwt.decode(
             jwt=token, key=settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
+        token_cache.put(token, dict(token_data))
         return token_data
     except ExpiredSignatureError:
         raise ValueError("Token has expired")
@@ -46,3 +108,37 @@ def decode_url_safe_token(token: str):
     except Exception as e:
         logger.error(str(e))
         return None
+
+
+def session_id(access_token: str) -> str:
+    """Short stable id of a login session, without exposing its access token."""
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:32]
+
+
+def create_resume_token(data: dict):
+    return resume_serializer.dumps(data)
+
+
+def decode_resume_token(token: str, game: str, session: str | None):
+    """
+    Claims of a resume token issued for the game, None if it is not valid.
+    A token never outlives the access token, and when the client still sends
+    its session cookie the token must have been issued to that session.
+    """
+    try:
+        claims = resume_serializer.loads(
+            token,
+            max_age=min(
+                settings.WS_RESUME_TOKEN_MAX_AGE, settings.ACCESS_TOKEN_EXPIRE_SECONDS
+            ),
+        )
+    except Exception as e:
+        logger.info(f"Rejected resume token: {e}")
+        return None
+    if claims.get("game") != game:
+        logger.info("Rejected resume token of another game")
+        return None
+    if session is not None and claims.get("session") != session:
+        logger.info("Rejected resume token of another session")
+        return None
+    return claims
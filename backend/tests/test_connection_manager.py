@@ -0,0 +1,46 @@
+import uuid
+
+from app.game.codec import Encoding
+from app.game.connection_manager import Connection, ConnectionManager
+from app.game.outbox import FrameKind, Outbox, OverflowPolicy
+
+
+def held_connection(manager: ConnectionManager, outbox: Outbox) -> Connection:
+    game, websocket = uuid.uuid4(), object()
+    connection = Connection(game, websocket, Encoding.json, outbox)
+    manager.connections[websocket] = connection
+    manager.hold(game)
+    return connection
+
+
+def test_held_frames_are_batched_by_kind():
+    manager = ConnectionManager()
+    connection = held_connection(manager, Outbox(16, OverflowPolicy.coalesce))
+    for frame, kind in [
+        ("1", FrameKind.event),
+        ("2", FrameKind.event),
+        ('{"seq":2}', FrameKind.state),
+        ('"hi"', FrameKind.chat),
+        ("3", FrameKind.event),
+    ]:
+        manager._enqueue(connection, frame, kind)
+
+    manager.flush(connection.game)
+
+    assert connection.outbox.drain(16) == ["[1,2]", '{"seq":2}', '"hi"', "3"]
+
+
+def test_held_state_frame_is_still_coalesced():
+    manager = ConnectionManager()
+    outbox = Outbox(2, OverflowPolicy.coalesce)
+    outbox.put('{"seq":1}', FrameKind.state)
+    outbox.put("1", FrameKind.event)
+    connection = held_connection(manager, outbox)
+    manager._enqueue(connection, '{"seq":2}', FrameKind.state)
+    manager._enqueue(connection, '"hi"', FrameKind.chat)
+
+    manager.flush(connection.game)
+
+    # The newer state replaces the queued one, the chat message is given up.
+    assert manager.connections[connection.websocket] is connection
+    assert outbox.drain(2) == ["1", '{"seq":2}']
@@ -0,0 +1,104 @@
+import pytest
+
+from app.game import engine
+from app.game.data import cards, tiles
+from app.game.engine import BoardTables, GameRuleError
+from app.game.game_state import STARTING_BALANCE, GameState, GameStatus
+
+TABLES = BoardTables.from_data(tiles, cards)
+
+
+def started_game(*actions) -> GameState:
+    """A two player game, started without a seed so cards are drawn in deck order."""
+    state = GameState(TABLES)
+    for action in (["join", 1, "alice"], ["join", 2, "bob"], ["start"], *actions):
+        engine.apply(TABLES, state, action)
+    return state
+
+
+@pytest.mark.parametrize("status", [GameStatus.started, GameStatus.finished])
+def test_start_is_rejected_once_the_game_is_under_way(status):
+    state = started_game(["roll", 0, 1, 2], ["buy", 0])
+    state.status = status
+    dumped = state.dumps()
+
+    with pytest.raises(GameRuleError):
+        engine.apply(TABLES, state, ["start", 1234])
+    assert state.dumps() == dumped
+
+
+def test_go_to_jail_tile():
+    state = started_game()
+    state.positions[0] = 25
+
+    events = engine.apply(TABLES, state, ["roll", 0, 2, 3])
+
+    assert state.positions[0] == TABLES.jail
+    assert state.jail_turns[0] == 1
+    assert ("jail", 0, True) in events
+    assert state.rolled
+
+
+def test_third_double_goes_to_jail():
+    state = started_game(["roll", 0, 3, 3], ["roll", 0, 3, 3])
+    assert not state.rolled
+
+    events = engine.apply(TABLES, state, ["roll", 0, 3, 3])
+
+    assert state.positions[0] == TABLES.jail
+    assert events[-1] == ("jail", 0, True)
+    assert state.rolled and state.doubles == 0
+
+
+def test_jail_is_left_with_a_fine_after_the_last_turn():
+    state = started_game()
+    state.positions[0] = 25
+    for dice in ((2, 3), (1, 2), (1, 2)):
+        engine.apply(TABLES, state, ["roll", 0, *dice])
+        engine.apply(TABLES, state, ["end", 0])
+        engine.apply(TABLES, state, ["roll", 1, 1, 3])
+        engine.apply(TABLES, state, ["end", 1])
+    assert state.jail_turns[0] == engine.MAX_JAIL_TURNS
+
+    events = engine.apply(TABLES, state, ["roll", 0, 1, 2])
+
+    assert ("jail", 0, False) in events
+    assert state.positions[0] == TABLES.jail + 3
+    assert state.balances[0] == STARTING_BALANCE - engine.JAIL_FINE
+
+
+def test_chance_card_is_drawn_and_applied():
+    state = started_game()
+
+    events = engine.apply(TABLES, state, ["roll", 0, 3, 4])
+
+    description = TABLES.decks[0][0].description
+    assert ("draw", 0, "chance", description) in events
+    assert state.positions[0] == 0
+    assert state.balances[0] == STARTING_BALANCE + engine.GO_SALARY
+    assert state.card_next[0] == 1
+
+
+def test_replaying_the_log_rebuilds_the_state():
+    log = [
+        ["join", 1, "alice"],
+        ["join", 2, "bob"],
+        ["start", 42],
+        ["roll", 0, 1, 2],
+        ["buy", 0],
+        ["end", 0],
+        ["roll", 1, 3, 4],
+        ["end", 1],
+        ["roll", 0, 5, 5],
+        ["roll", 0, 2, 5],
+    ]
+    played = GameState(TABLES)
+    for action in log:
+        engine.apply(TABLES, played, action)
+    replayed = GameState(TABLES)
+    for action in log:
+        engine.apply(TABLES, replayed, action)
+
+    assert played.seq == len(log)
+    assert replayed.dumps() == played.dumps()
+    assert GameState.loads(played.dumps(), TABLES).dumps() == played.dumps()
@@ -0,0 +1,237 @@
+import asyncio
+import uuid
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.game.backend.base import WORKER_ID
+from app.game.backend.redis_backend import (
+    BOARD_KEY,
+    EVENTS_CHANNEL,
+    LOGGED_KEY,
+    OWNER_KEY,
+    STATE_KEY,
+    RedisRoomBackend,
+)
+
+OTHER_WORKER = "other-host:1"
+
+
+def make_backend(server, **kwargs) -> RedisRoomBackend:
+    return RedisRoomBackend(fakeredis.FakeAsyncRedis(server=server), state_ttl=60, **kwargs)
+
+
+def test_lease_is_taken_once_and_released():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server)
+        game = uuid.uuid4()
+
+        assert await backend.acquire_room(game) == WORKER_ID
+        assert backend.owns(game)
+        # Asking again while holding the lease keeps it.
+        assert await backend.acquire_room(game) == WORKER_ID
+
+        await backend.release_room(game)
+        assert not backend.owns(game)
+        assert await backend.client.get(OWNER_KEY.format(game)) is None
+
+    asyncio.run(scenario())
+
+
+def test_room_owned_by_another_worker_is_not_taken():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server)
+        game = uuid.uuid4()
+        await backend.client.set(OWNER_KEY.format(game), OTHER_WORKER)
+
+        assert await backend.acquire_room(game) == OTHER_WORKER
+        assert not backend.owns(game)
+        # Releasing a room we do not own leaves the other lease alone.
+        await backend.release_room(game)
+        assert await backend.client.get(OWNER_KEY.format(game)) == OTHER_WORKER.encode()
+
+    asyncio.run(scenario())
+
+
+def test_state_of_owned_rooms_is_written_behind():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server)
+        owned, other = uuid.uuid4(), uuid.uuid4()
+        await backend.acquire_room(owned)
+
+        await backend.save_state(owned, b"owned")
+        await backend.save_state(other, b"other")
+        assert await backend.load_state(owned) is None
+        assert await backend.load_state(other) == b"other"
+
+        # Releasing the lease writes what is still pending.
+        await backend.release_room(owned)
+        assert await backend.load_state(owned) == b"owned"
+        assert await backend.client.ttl(STATE_KEY.format(owned)) > 0
+
+        await backend.delete_state(other)
+        assert await backend.load_state(other) is None
+
+    asyncio.run(scenario())
+
+
+def test_rooms_are_known_to_be_logged_until_unused_for_log_ttl():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server, log_ttl=600)
+        game = uuid.uuid4()
+        assert not await backend.is_logged(game)
+
+        await backend.mark_logged(game)
+        assert await backend.is_logged(game)
+        await backend.client.expire(LOGGED_KEY.format(game), 5)
+
+        # Writing the room's state keeps the mark for another log_ttl.
+        await backend.acquire_room(game)
+        await backend.save_state(game, b"state")
+        await backend.release_room(game)
+        assert await backend.client.ttl(LOGGED_KEY.format(game)) > 5
+
+    asyncio.run(scenario())
+
+
+def test_lost_lease_is_dropped_on_renewal():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server, lease_seconds=1)
+        game = uuid.uuid4()
+        await backend.start(lambda *message: None)
+        try:
+            await backend.acquire_room(game)
+            await backend.client.set(OWNER_KEY.format(game), OTHER_WORKER)
+            await backend.save_state(game, b"stale")
+            await asyncio.sleep(0.5)
+            assert not backend.owns(game)
+        finally:
+            await backend.stop()
+        # The new owner's state is not overwritten by ours.
+        assert await make_backend(server).load_state(game) is None
+
+    asyncio.run(scenario())
+
+
+def test_frames_of_other_workers_are_delivered():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        backend = make_backend(server)
+        received = []
+        await backend.start(lambda *message: received.append(message))
+        try:
+            game = uuid.uuid4()
+            publisher = fakeredis.FakeAsyncRedis(server=server)
+            await asyncio.sleep(0.05)
+            await publisher.publish(EVENTS_CHANNEL.format(game), f"{WORKER_ID}|game|own")
+            await publisher.publish(
+                EVENTS_CHANNEL.format(game), f"{OTHER_WORKER}|game|hello"
+            )
+            for _ in range(50):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await backend.stop()
+        assert received == [(game, "game", "hello")]
+
+    asyncio.run(scenario())
+
+
+def test_board_reloads_reach_every_worker():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        reloader, worker = make_backend(server), make_backend(server)
+        digests = []
+
+        async def on_board(digest):
+            digests.append(digest)
+
+        await reloader.start(lambda *message: None)
+        await worker.start(lambda *message: None, on_board)
+        try:
+            await asyncio.sleep(0.05)
+            await reloader.announce_board("new")
+            for _ in range(50):
+                if digests:
+                    break
+                await asyncio.sleep(0.01)
+            assert digests == ["new"]
+
+            # Workers that were not listening pick up the last digest on start.
+            late = make_backend(server)
+            await late.start(lambda *message: None, on_board)
+            await asyncio.sleep(0.05)
+            await late.stop()
+        finally:
+            await reloader.stop()
+            await worker.stop()
+        assert digests == ["new", "new"]
+        assert await fakeredis.FakeAsyncRedis(server=server).get(BOARD_KEY) == b"new"
+
+    asyncio.run(scenario())
+
+
+def test_quick_join_fills_the_fullest_room_of_the_pool():
+    async def scenario():
+        backend = make_backend(fakeredis.FakeServer())
+        pool, other_pool = ("eu", 0), ("eu", 1)
+
+        first = await backend.quick_join(1, pool)
+        assert await backend.quick_join(2, pool) == first
+        # Asking again keeps the seat already held.
+        assert await backend.quick_join(2, pool) == first
+        assert await backend.quick_join(3, other_pool) != first
+        assert await backend.open_rooms(pool) == [{"game": first, "free": 2}]
+
+        # A user holds one seat at a time.
+        assert await backend.reserve_seat(first, 3, pool)
+        assert await backend.open_rooms(other_pool) == []
+        assert await backend.open_rooms(pool) == [{"game": first, "free": 1}]
+        assert await backend.public_rooms() == 1
+
+    asyncio.run(scenario())
+
+
+def test_seat_reservations_count_as_taken():
+    async def scenario():
+        backend = make_backend(fakeredis.FakeServer())
+        pool = ("eu", 0)
+        game = await backend.quick_join(1, pool)
+        for user_id in (2, 3, 4):
+            assert await backend.reserve_seat(game, user_id, pool)
+
+        assert not await backend.reserve_seat(game, 5, pool)
+        assert not await backend.has_seat(game, 5, seated=0)
+        assert await backend.has_seat(game, 4, seated=0)
+        # Rooms of another pool cannot be joined from the lobby.
+        assert not await backend.reserve_seat(game, 5, ("us", 0))
+
+        await backend.update_public_room(game, [1, 2], is_open=True)
+        assert await backend.open_rooms(pool) == []
+        await backend.update_public_room(game, [1, 2, 3, 4], is_open=False)
+        assert await backend.public_rooms() == 0
+        assert not await backend.reserve_seat(game, 5, pool)
+
+    asyncio.run(scenario())
+
+
+def test_expired_reservations_free_their_seats():
+    async def scenario():
+        backend = make_backend(fakeredis.FakeServer(), reservation_seconds=0.05)
+        pool = ("eu", 0)
+        game = await backend.quick_join(1, pool)
+        await backend.quick_join(2, pool)
+        await backend.update_public_room(game, [1], is_open=True)
+        await asyncio.sleep(0.1)
+
+        assert await backend.open_rooms(pool) == [{"game": game, "free": 3}]
+        assert await backend.quick_join(3, pool) == game
+
+    asyncio.run(scenario())
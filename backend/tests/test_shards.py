@@ -0,0 +1,45 @@
+import asyncio
+import pickle
+import uuid
+
+import pytest
+
+from app.game.shards import Shard, ShardPool
+
+
+class Pipe:
+    """Stands in for the shard's end of the pipe, refusing "bad" requests."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, request):
+        if request[1] == "bad":
+            raise pickle.PicklingError("cannot pickle")
+        self.sent.append(request)
+
+
+def test_unsendable_request_fails_without_stopping_the_writer():
+    async def scenario():
+        pool = ShardPool(1)
+        shard = Shard(0, None, Pipe())
+        shard.boards.add(1)
+        writer = asyncio.create_task(pool._write(shard))
+        try:
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(pool._request(shard, "bad", uuid.uuid4(), None), 1)
+            assert not shard.pending
+            # The shard may have missed the tables, they are sent again.
+            assert not shard.boards
+
+            pool._request(shard, "forget", uuid.uuid4(), None)
+            for _ in range(50):
+                if shard.conn.sent:
+                    break
+                await asyncio.sleep(0.01)
+            assert [request[1] for request in shard.conn.sent] == ["forget"]
+            assert not writer.done()
+        finally:
+            writer.cancel()
+
+    asyncio.run(scenario())
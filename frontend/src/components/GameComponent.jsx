@@ -16,10 +16,98 @@ import {AlertCircle, Dices, Play, Copy, CheckCircle2} from 'lucide-react';
 import {cn} from '@/lib/utils';
 import {useToast} from '@/hooks/use-toast';
 
+// Applies the events of a delta frame to the state received in the last state frame.
+const applyEvents = (prev, events) => {
+    const state = {
+        ...prev,
+        users: [...prev.users],
+        positions: [...prev.positions],
+        balances: [...prev.balances],
+        jail: [...prev.jail],
+        bankrupt: [...prev.bankrupt],
+        owners: [...prev.owners],
+        houses: [...prev.houses],
+        mortgaged: [...prev.mortgaged],
+    };
+    for (const [name, ...args] of events) {
+        switch (name) {
+            case 'join':
+                state.users.push([args[0], args[1]]);
+                break;
+            case 'leave':
+                state.users = state.users.filter(([id]) => id !== args[0]);
+                break;
+            case 'start':
+                state.status = 'started';
+                state.players = args[0];
+                state.turn = 0;
+                state.positions = args[0].map(() => 0);
+                state.balances = args[0].map(() => args[1]);
+                state.jail = args[0].map(() => 0);
+                state.bankrupt = args[0].map(() => 0);
+                break;
+            case 'roll':
+                state.rolled = true;
+                state.pending = -1;
+                break;
+            case 'again':
+                state.rolled = false;
+                break;
+            case 'move':
+                state.positions[args[0]] = args[2];
+                break;
+            case 'balance':
+                state.balances[args[0]] = args[1];
+                break;
+            case 'offer':
+                state.pending = args[1];
+                break;
+            case 'owner':
+                state.owners[args[0]] = args[1];
+                state.pending = -1;
+                break;
+            case 'houses':
+                state.houses[args[0]] = args[1];
+                break;
+            case 'mortgage':
+                state.mortgaged[args[0]] = args[1] ? 1 : 0;
+                break;
+            case 'jail':
+                state.jail[args[0]] = args[1] ? 1 : 0;
+                break;
+            case 'turn':
+                state.turn = args[0];
+                state.rolled = false;
+                state.pending = -1;
+                break;
+            case 'bankrupt':
+                state.bankrupt[args[0]] = 1;
+                state.owners.forEach((owner, tile) => {
+                    if (owner === args[0]) {
+                        state.owners[tile] = -1;
+                        state.houses[tile] = 0;
+                        state.mortgaged[tile] = 0;
+                    }
+                });
+                break;
+            case 'winner':
+                state.status = 'finished';
+                break;
+            default:
+                break;
+        }
+    }
+    return state;
+};
+
 export const GameComponent = () => {
     const {game_uuid} = useParams();
     const [boardTiles, setBoardTiles] = useState([]);
     const [messages, setMessages] = useState([]);
+    const [gameState, setGameState] = useState(null);
+    const seq = useRef(0);
+    const resumeToken = useRef(null);
+    const resumeAttempts = useRef(0);
     const [selectedTile, setSelectedTile] = useState(null);
     const [copied, setCopied] = useState(false);
     const [dialogOpen, setDialogOpen] = useState(false);
@@ -29,39 +117,99 @@ export const GameComponent = () => {
     useEffect(() => {
         if (game_uuid) {
             const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
-            ws.current = new WebSocket(
-                `${protocol}://${window.location.host}/api/ws/game/${game_uuid}`
-            );
+            connect(`${protocol}://${window.location.host}/api/ws/game/${game_uuid}`);
+
+            return () => {
+                if (ws.current) {
+                    ws.current.onclose = null;
+                    ws.current.close();
+                }
+            };
+        }
+
+        function connect(url) {
+            const baseUrl = url.split('?')[0];
+            ws.current = new WebSocket(url);
 
             ws.current.onopen = () => {
                 console.log('WebSocket connected');
             };
 
+            const handleMessage = (data) => {
+                if (data.type === 'game' && Array.isArray(data.content)) {
+                    const sortedTiles = data.content.sort((a, b) => a.index - b.index);
+                    setBoardTiles(sortedTiles);
+                } else if (data.type === 'resume') {
+                    resumeToken.current = data.content;
+                    resumeAttempts.current = 0;
+                } else if (data.type === 'state') {
+                    seq.current = data.seq;
+                    setGameState(data.content);
+                } else if (data.type === 'delta') {
+                    if (data.seq <= seq.current) {
+                        return;
+                    }
+                    if (data.seq !== seq.current + 1) {
+                        // A delta went missing, ask for the full state again.
+                        seq.current = Infinity;
+                        ws.current.send(JSON.stringify({type: 'resync'}));
+                        return;
+                    }
+                    seq.current = data.seq;
+                    setGameState((prev) => prev && applyEvents(prev, data.content));
+                } else {
+                    setMessages((prev) => [...prev, data]);
+                }
+            };
+
             ws.current.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    if (data.type === 'game' && Array.isArray(data.content)) {
-                        const sortedTiles = data.content.sort((a, b) => a.index - b.index);
-                        setBoardTiles(sortedTiles);
-                    } else {
-                        setMessages((prev) => [...prev, data]);
-                    }
+                    // Batched frames carry several messages in one array, a
+                    // command's messages may be batched again with others.
+                    const dispatch = (message) =>
+                        Array.isArray(message) ? message.forEach(dispatch) : handleMessage(message);
+                    dispatch(data);
                 } catch (error) {
                     console.error('Error parsing message:', error);
                 }
             };
 
-            ws.current.onclose = () => {
+            ws.current.onclose = (event) => {
+                // The room is owned by another backend node, reconnect through it.
+                if (event.code === 4307 && event.reason) {
+                    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                    connect(
+                        `${protocol}://${window.location.host}/api/ws/node/${event.reason}/game/${game_uuid}`
+                    );
+                    return;
+                }
+                // Another worker process of the same node owns the room, try again.
+                if (event.code === 4308 && resumeAttempts.current < 5) {
+                    resumeAttempts.current += 1;
+                    setTimeout(() => connect(url), 200 * resumeAttempts.current);
+                    return;
+                }
+                // Dropped connection, resume the session and catch up on missed deltas.
+                if (
+                    resumeToken.current &&
+                    event.code !== 1000 &&
+                    resumeAttempts.current < 5
+                ) {
+                    resumeAttempts.current += 1;
+                    const params = new URLSearchParams({resume: resumeToken.current});
+                    if (Number.isFinite(seq.current)) {
+                        params.set('since', seq.current);
+                    }
+                    setTimeout(() => connect(`${baseUrl}?${params}`), 1000);
+                    return;
+                }
                 console.log('WebSocket disconnected');
             };
 
             ws.current.onerror = (error) => {
                 console.error('WebSocket error:', error);
             };
-
-            return () => {
-                if (ws.current) ws.current.close();
-            };
         }
     }, [game_uuid]);
 
@@ -464,6 +612,21 @@ export const GameComponent = () => {
                         </Button>
                     </div>
 
+                    {gameState && gameState.players.length > 0 && (
+                        <div className="flex flex-wrap gap-2 mb-6">
+                            {gameState.players.map((userId, seat) => (
+                                <Badge
+                                    key={userId}
+                                    variant={seat === gameState.turn ? 'default' : 'outline'}
+                                    className={cn(gameState.bankrupt[seat] && 'line-through')}
+                                >
+                                    {(gameState.users.find(([id]) => id === userId) || [])[1]}:{' '}
+                                    {gameState.balances[seat]}
+                                </Badge>
+                            ))}
+                        </div>
+                    )}
+
                     <div className="border-2 border-gray-900 rounded-lg shadow-lg bg-white mx-auto max-w-fit">
                         {renderTopRow()}
                         <div className="flex">